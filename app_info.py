@@ -10,7 +10,7 @@ import sys
 import os
 
 TITLE = "CSV Viewer"
-VERSION = 2.6
+VERSION = 2.7
 
 def app_dir():
 
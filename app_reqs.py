@@ -20,4 +20,7 @@ class REQS:
     ABOUT_DIALOG = 7
     GET_SPECIAL_ACTIONS = 8
     GET_PLOTTING_STYLE = 9
+    DIAGNOSTICS_DIALOG = 10
+    CANCEL_LOAD = 11
+    SET_VIEW_RANGE = 12
 
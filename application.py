@@ -8,18 +8,40 @@ Entry file for the CSV viewer application
 
 import argparse
 import logging
+import os
+import sys
+import time
+import multiprocessing
+import concurrent.futures
+from collections import OrderedDict
 from configmanager import ConfigManager
 
-from datamanager import DataManager, EVT_DATA_LOAD_COMPLETE, EVT_DATA_PROCESSING_COMPLETE
-from gui import GUI, ask_directory, run_gui, show_info_dialog
+from gui import GUI, ask_directory, ask_save_filename, run_gui, show_info_dialog
 from plotter import Plotter, WindPlotter, Histogram
 from app_reqs import REQS
+import timing
 
 import queue
-import threading
+import datetime
 
 from app_info import VERSION, TITLE
 
+# How often (in milliseconds) the Tk main loop checks for data loading progress
+PROGRESS_POLL_MS = 100
+
+# How often (in milliseconds) the Tk main loop checks for results from the worker pool
+WORKER_POLL_MS = 20
+
+# Requests that are queued and handled in batches when the Tk main loop is idle.
+# Only the last of each queued request is handled, so e.g. scrolling through a
+# dropdown only fetches and draws the final selection.
+QUEUED_REQUESTS = (
+    REQS.CHANGE_SUBPLOT1, REQS.CHANGE_SUBPLOT2, REQS.CHANGE_SUBPLOT3,
+    REQS.AVERAGE_SUBPLOT_DATA, REQS.RESET_SUBPLOT_DATA, REQS.SPECIAL_OPTION, REQS.SET_VIEW_RANGE)
+
+# Number of threads in the worker pool used for averaging, windrose and histogram requests
+WORKER_THREADS = 2
+
 def get_arg_parser():
     """ Return a command line argument parser for this module """
     arg_parser = argparse.ArgumentParser(
@@ -29,6 +51,38 @@ def get_arg_parser():
         '--start_folder', dest='start_folder', default=None,
         help="The folder to look for CSVs in")
 
+    arg_parser.add_argument(
+        '--load_from', dest='load_from', type=parse_date, default=None, metavar='YYYY-MM-DD',
+        help="Only load data from this date (for --start_folder and --batch)")
+
+    arg_parser.add_argument(
+        '--load_to', dest='load_to', type=parse_date, default=None, metavar='YYYY-MM-DD',
+        help="Only load data up to and including this date (for --start_folder and --batch)")
+
+    arg_parser.add_argument(
+        '--timing', dest='timing', action='store_true',
+        help="Record how long loading and drawing stages take (see the Diagnostics window)")
+
+    arg_parser.add_argument(
+        '--timing_file', dest='timing_file', default=None,
+        help="Record stage timings and write them to this JSON file on exit")
+
+    arg_parser.add_argument(
+        '--batch', dest='batch_folders', nargs='+', default=None, metavar='FOLDER',
+        help="Render plots for each folder to image files, without the GUI")
+
+    arg_parser.add_argument(
+        '--output_dir', dest='output_dir', default='.',
+        help="The folder to write batch plots to (one subfolder per data folder)")
+
+    arg_parser.add_argument(
+        '--formats', dest='formats', nargs='+', default=['png'], choices=['png', 'svg', 'pdf'],
+        help="Image formats to write batch plots in")
+
+    arg_parser.add_argument(
+        '--jobs', dest='jobs', type=int, default=None,
+        help="Number of worker processes for batch rendering (default: one per CPU)")
+
     return arg_parser
 
 def get_module_logger():
@@ -36,6 +90,160 @@ def get_module_logger():
     """ Returns logger for this module """
     return logging.getLogger(__name__)
 
+def get_plotting_style(configmanager, data_manager, display_name):
+    """
+    Each field can have a style when plotted.
+    This function build that style based on dataset configuration.
+    If there is no config, the default plot style is a blue line.
+    """
+
+    styles = None
+    if configmanager.has_dataset_config() and display_name is not None:
+        try:
+            field_name = data_manager.get_field_name_from_display_name(display_name)
+            styles = configmanager.get_dataset_config('FORMATTING', field_name)
+
+            styles = [style.strip() for style in styles.split(",")]
+
+            if styles[0] == '':
+                styles[0] = 'line' #Add the default plot style
+
+            if len(styles) == 1:
+                styles.append('b') #Add the default colour (blue)
+
+        except KeyError:
+            pass # This field name not in the config file
+
+    return ["line", "b"] if styles is None else styles
+
+def get_default_display_names(configmanager, data_manager):
+    """
+    Returns the display names of (up to) three datasets to show when data is first loaded.
+    Default fields from config come first, then the plots are filled in order from the datasets.
+    """
+
+    # Get the default fields from config
+    default_fields = configmanager.get_global_config('DEFAULT', 'DefaultFields')
+    default_fields = [field.strip() for field in default_fields.split(",")]
+
+    numeric_fields = data_manager.get_numeric_field_names()
+    fields = [field for field in default_fields if field in numeric_fields]
+
+    # If field count is less than 3, fill the rest of the plots in order from datasets
+    fields += [field for field in numeric_fields if field not in default_fields]
+
+    return [data_manager.get_display_name(field) for field in fields[:3]]
+
+def parse_date(text):
+    """
+    Converts YYYY-MM-DD text to a date (or None if the text is empty)
+    Raises ValueError if the text is not a valid date
+    """
+    return datetime.datetime.strptime(text, "%Y-%m-%d").date() if text else None
+
+def get_memory_setting(configmanager, key):
+    """
+    Returns a size in bytes from a megabytes setting in the [MEMORY] section of config.ini
+    (None if the setting is missing, not a number or 0)
+    Args:
+    key: The setting name (e.g. BudgetMB)
+    """
+    try:
+        setting_mb = float(configmanager.get_global_config('MEMORY', key))
+    except ValueError:
+        return None # Not set, or not a number
+
+    return setting_mb * 1e6 if setting_mb > 0 else None
+
+def get_memory_budget(configmanager):
+    """ Returns the memory budget (in bytes) above which the user is warned, or None if there is no budget """
+    return get_memory_setting(configmanager, 'BudgetMB')
+
+def get_column_cache_settings(configmanager):
+    """
+    Returns (cache budget in bytes or None, spill folder or None) for a DataManager,
+    from the [MEMORY] ColumnCacheMB and SpillFolder settings in config.ini
+    """
+    spill_dir = configmanager.get_global_config('MEMORY', 'SpillFolder').strip()
+    return (get_memory_setting(configmanager, 'ColumnCacheMB'), spill_dir if spill_dir else None)
+
+def get_folder_manifest(configmanager, folder):
+    """
+    Returns the manifest.FolderManifest of a data folder, kept in the [LOADING] ManifestFolder
+    set in config.ini (or the user's cache folder if that is not set).
+    Returns None if the manifest cannot be opened (loading then works without it).
+    """
+    import sqlite3 #pylint: disable=import-outside-toplevel
+    from manifest import FolderManifest #pylint: disable=import-outside-toplevel
+
+    manifest_dir = configmanager.get_global_config('LOADING', 'ManifestFolder').strip()
+    try:
+        return FolderManifest(folder, manifest_dir if manifest_dir else None)
+    except (sqlite3.Error, OSError) as exc:
+        get_module_logger().warning("Could not open folder manifest for %s (%s)", folder, exc)
+        return None
+
+def get_load_options(configmanager):
+    """
+    Returns datamanager.LoadOptions from the [LOADING] settings in config.ini
+    (any setting that is missing or not a number keeps its default)
+    """
+    import datamanager #pylint: disable=import-outside-toplevel
+
+    options = datamanager.DEFAULT_LOAD_OPTIONS
+
+    try:
+        split_mb = float(configmanager.get_global_config('LOADING', 'SplitFileMB'))
+        options = options._replace(split_bytes=split_mb * 1e6 if split_mb > 0 else None)
+    except ValueError:
+        pass
+
+    try:
+        processes = int(configmanager.get_global_config('LOADING', 'ParseProcesses'))
+        options = options._replace(parse_processes=processes if processes > 0 else None)
+    except ValueError:
+        pass
+
+    try:
+        prefetch_files = int(configmanager.get_global_config('LOADING', 'PrefetchFiles'))
+        options = options._replace(prefetch_files=max(0, prefetch_files))
+    except ValueError:
+        pass
+
+    try:
+        prefetch_mb = float(configmanager.get_global_config('LOADING', 'PrefetchMB'))
+        options = options._replace(prefetch_bytes=prefetch_mb * 1e6)
+    except ValueError:
+        pass
+
+    parser = configmanager.get_global_config('LOADING', 'Parser').strip()
+    if parser:
+        from parsers import PARSER_NAMES #pylint: disable=import-outside-toplevel
+        if parser in PARSER_NAMES:
+            options = options._replace(parser=parser)
+        else:
+            get_module_logger().warning("Unknown parser '%s' in config.ini (choose from %s)", parser, PARSER_NAMES)
+
+    return options
+
+def get_date_range(start, end):
+    """ Returns (start, end) as a DataManager date range, or None if neither is set """
+    return None if start is None and end is None else (start, end)
+
+def describe_progress(event):
+    """
+    Returns a line of text describing loading throughput (and time remaining while files are read)
+    Args:
+    event: A datamanager.ProgressEvent
+    """
+    text = "%.1f MB of %.1f MB, %.1f MB/s, %d rows/s" % (
+        event.bytes_read / 1e6, event.total_bytes / 1e6, event.bytes_per_second / 1e6, event.rows_per_second)
+
+    if event.eta_seconds is not None:
+        text += ", about %d s remaining" % round(event.eta_seconds)
+
+    return text
+
 def show_about_dialog():
     """
     Show information about this program
@@ -75,11 +283,11 @@ class Application:
     Handles interaction between GUI events, GUI drawing, plotting, file reading etc.
     """
 
-    def __init__(self, _):
+    def __init__(self, args):
 
         """
         Args:
-        _ : Command line arguments (not currently used)
+        args : Command line arguments
         """
 
         self.configmanager = ConfigManager(".")
@@ -89,11 +297,89 @@ class Application:
         self.histogram = Histogram()
 
         self.msg_queue = None
-        self.loading_timer = None
         self.data_manager = None
+        self.loading_data_manager = None
+
+        # (start, end) dates of the data shown on the plots (None for no limit)
+        self.view_range = (None, None)
+
+        # Long computations run on the worker pool. The latest future for each kind
+        # of work is kept, so results of requests that have since been replaced are dropped.
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=WORKER_THREADS)
+        self.pending_work = {}
+
+        # Requests waiting to be handled, keyed by request ID, in the order they were last made
+        self.request_queue = OrderedDict()
 
         self.gui = GUI(self.request_handler)
 
+        if args.start_folder is not None:
+            # Load once the main loop is running, so the window is shown first
+            self.gui.schedule_idle(
+                lambda: self.load_folder(args.start_folder, get_date_range(args.load_from, args.load_to)))
+
+    def submit_work(self, kind, function, on_result, on_error=None):
+        """
+        Runs a function on the worker pool, then passes its result to on_result on the Tk main loop.
+        Submitting new work of the same kind makes any earlier result stale, and it is dropped.
+        Args:
+        kind : Hashable identifying what the work is for (e.g. ("average", 0) for averaging subplot 0)
+        function : The function to run on the worker pool (with no arguments)
+        on_result : Called with the function's result
+        on_error : Called with the exception if the function raises one (by default, it is logged)
+        """
+        future = self.executor.submit(function)
+        self.cancel_work(kind)
+        self.pending_work[kind] = future
+        self.gui.schedule(WORKER_POLL_MS, lambda: self.check_work(kind, future, on_result, on_error))
+
+    def cancel_work(self, kind=None):
+        """
+        Drops the result of pending work, and cancels it if it has not started yet
+        Args:
+        kind : The kind of work to drop (None to drop all pending work)
+        """
+        if kind is None:
+            futures = list(self.pending_work.values())
+            self.pending_work = {}
+        else:
+            futures = [self.pending_work.pop(kind)] if kind in self.pending_work else []
+
+        for future in futures:
+            future.cancel()
+
+    def shutdown_work(self):
+        """
+        Cancels work that has not started and shuts down the worker pool without waiting.
+        Work that has already started still runs to the end: Python waits for the worker threads before it exits.
+        """
+        self.cancel_work()
+        self.executor.shutdown(wait=False)
+
+    def check_work(self, kind, future, on_result, on_error):
+        """ Runs on the Tk main loop until submitted work has finished, then applies its result """
+
+        if self.pending_work.get(kind) is not future:
+            return # This work has been replaced or cancelled, so its result is stale
+
+        if not future.done():
+            self.gui.schedule(WORKER_POLL_MS, lambda: self.check_work(kind, future, on_result, on_error))
+            return
+
+        del self.pending_work[kind]
+
+        try:
+            result = future.result()
+        except Exception as exc: #pylint: disable=broad-except
+            if on_error is not None:
+                on_error(exc)
+            else:
+                get_module_logger().error(
+                    "Worker request %s failed", kind, exc_info=(type(exc), exc, exc.__traceback__))
+            return
+
+        on_result(result)
+
     def request_handler(self, request, *args):
         """
         This function is passed to the GUI.
@@ -105,6 +391,45 @@ class Application:
         args: List of additional argument that may be required on a per-request basis
         """
 
+        if request in QUEUED_REQUESTS:
+            self.queue_request(request, args)
+            return None
+
+        return self.handle_request(request, *args)
+
+    def queue_request(self, request, args):
+        """
+        Queues a request to be handled when the Tk main loop is idle.
+        A request already in the queue is superseded by the new one (and its arguments).
+        Args:
+        request: One of the request IDs in QUEUED_REQUESTS
+        args: List of additional arguments for the request
+        """
+        if not self.request_queue:
+            self.gui.schedule_idle(self.process_requests)
+
+        if request in self.request_queue:
+            get_module_logger().info("Request %d superseded", request)
+            del self.request_queue[request]
+
+        self.request_queue[request] = args
+
+    @timing.timed
+    def process_requests(self):
+        """ Handles the queued requests as one batch. Figures are drawn once, after the whole batch """
+        (requests, self.request_queue) = (self.request_queue, OrderedDict())
+
+        for request, args in requests.items():
+            self.handle_request(request, *args)
+
+    def handle_request(self, request, *args):
+        """
+        Carries out a request
+        Args:
+        request: One of the request IDs defined in app_reqs.py
+        args: List of additional argument that may be required on a per-request basis
+        """
+
         if request == REQS.CHANGE_SUBPLOT1:
             self.action_subplot_change(0, args[0])
         elif request == REQS.CHANGE_SUBPLOT2:
@@ -121,11 +446,18 @@ class Application:
             self.action_new_data()
         elif request == REQS.ABOUT_DIALOG:
             show_about_dialog()
+        elif request == REQS.DIAGNOSTICS_DIALOG:
+            self.show_diagnostics()
+        elif request == REQS.CANCEL_LOAD:
+            self.action_cancel_load(args[0])
+        elif request == REQS.SET_VIEW_RANGE:
+            self.action_set_view_range()
         elif request == REQS.GET_SPECIAL_ACTIONS:
             return self.data_manager.get_special_dataset_options(args[0])
         elif request == REQS.GET_PLOTTING_STYLE:
             return self.get_plotting_style_for_field(args[0])
 
+    @timing.timed
     def action_subplot_change(self, subplot_index, display_name):
 
         """ Handles request to change subplot data
@@ -134,20 +466,34 @@ class Application:
         display_name : The display name of the requested data series
         """
 
+        self.set_subplot_dataset(subplot_index, display_name)
+
+        self.gui.set_dataset_choices(self.data_manager.get_numeric_display_names())
+        self.gui.draw(self.plotter)
+
+    def set_subplot_dataset(self, subplot_index, display_name):
+
+        """ Sets the data shown on a subplot, without drawing it
+        Args:
+        subplot_index : The index of the subpolot (0 to 2) to change
+        display_name : The display name of the requested data series
+        """
+
         get_module_logger().info("Changing subplot %d to %s", subplot_index, display_name)
 
+        # Any averaging still being computed for this subplot is now out of date
+        self.cancel_work(("average", subplot_index))
+
         self.plotter.set_visibility(subplot_index, display_name != "None")
         self.gui.set_displayed_field(display_name, subplot_index)
 
-        self.gui.set_dataset_choices(self.data_manager.get_numeric_display_names())
-
         if display_name != "None":
             self.plotter.set_dataset(
-                self.data_manager.get_timestamps(display_name), self.data_manager.get_dataset(display_name),
+                self.data_manager.get_timestamps(display_name, *self.view_range),
+                self.data_manager.get_dataset(display_name, *self.view_range),
                 display_name, subplot_index)
 
-        self.gui.draw(self.plotter)
-
+    @timing.timed
     def action_average_data(self):
 
         """ Handles request to show the average of a dataset """
@@ -173,40 +519,36 @@ class Application:
 
         time_period_seconds = time_period * time_multipliers[time_units]
 
-        (data, timestamps) = self.data_manager.get_dataset_average(display_name, time_period_seconds)
-
         index = self.gui.get_index_of_displayed_plot(display_name)
-
-        self.plotter.set_dataset(timestamps, data, display_name, index)
-
-        self.gui.draw(self.plotter)
+        data_manager = self.data_manager
+        (start, end) = self.view_range
+
+        def show_average(result):
+            """ Show the averaged data, if the subplot still shows this dataset """
+            if self.gui.get_index_of_displayed_plot(display_name) == index:
+                (data, timestamps) = result
+                self.plotter.set_dataset(timestamps, data, display_name, index)
+                self.gui.draw(self.plotter)
+
+        def average_error(exc):
+            """ Tell the user the data could not be averaged """
+            get_module_logger().info("Could not average data (%s)", exc)
+            show_info_dialog("Could not average data for %s" % display_name)
+
+        # Resampling can take a long time, so run it on the worker pool
+        self.submit_work(
+            ("average", index),
+            lambda: data_manager.get_dataset_average(display_name, time_period_seconds, start, end),
+            show_average, average_error)
 
     def get_plotting_style_for_field(self, display_name):
         """
         Each field can have a style when plotted.
-        This function build that style based on dataset configuration.
-        If there is no config, the default plot style is a blue line.
+        Returns the style for a field based on dataset configuration.
         """
+        return get_plotting_style(self.configmanager, self.data_manager, display_name)
 
-        styles = None
-        if self.configmanager.has_dataset_config() and display_name is not None:
-            try:
-                field_name = self.data_manager.get_field_name_from_display_name(display_name)
-                styles = self.configmanager.get_dataset_config('FORMATTING', field_name)
-
-                styles = [style.strip() for style in styles.split(",")]
-
-                if styles[0] == '':
-                    styles[0] = 'line' #Add the default plot style
-
-                if len(styles) == 1:
-                    styles.append('b') #Add the default colour (blue)
-
-            except KeyError:
-                pass # This field name not in the config file
-
-        return ["line", "b"] if styles is None else styles
-
+    @timing.timed
     def action_reset_average_data(self):
 
         """ Get the dataset of interest and reset the original data """
@@ -216,58 +558,163 @@ class Application:
 
         get_module_logger().info("Resetting dataset %s on subplot %d", display_name, subplot_index)
 
+        # Drop any averaging still being computed for this subplot
+        self.cancel_work(("average", subplot_index))
+
         self.plotter.set_dataset(
-            self.data_manager.get_timestamps(display_name), self.data_manager.get_dataset(display_name),
+            self.data_manager.get_timestamps(display_name, *self.view_range),
+            self.data_manager.get_dataset(display_name, *self.view_range),
             display_name, subplot_index)
 
         self.gui.draw(self.plotter)
 
+    @timing.timed
+    def action_set_view_range(self):
+
+        """ Handles request to show only a date range of data on the plots """
+
+        try:
+            view_range = tuple(parse_date(text) for text in self.gui.get_view_range())
+        except ValueError:
+            show_info_dialog("Could not read date range - dates must be in YYYY-MM-DD format")
+            return
+
+        get_module_logger().info("Showing data from %s to %s", *view_range)
+        self.view_range = view_range
+
+        if self.data_manager is None:
+            return # Applied when data is loaded
+
+        # Fetch only the data in range for each plot (any averaging is reset)
+        for index, display_name in enumerate(self.gui.get_displayed_fields()):
+            if display_name is not None:
+                self.set_subplot_dataset(index, display_name)
+
+        self.gui.draw(self.plotter)
+
+    @timing.timed
     def action_new_data(self):
 
-        """ Handles request to show open a new set of CSV files """
+        """ Handles request to show open a new set of CSV files (only loading the date range, if one is set) """
+
+        try:
+            date_range = get_date_range(*[parse_date(text) for text in self.gui.get_load_range()])
+        except ValueError:
+            show_info_dialog("Could not read date range - dates must be in YYYY-MM-DD format")
+            return
 
         new_directory = ask_directory("Choose directory to process")
 
-        if new_directory != '' and DataManager.directory_has_data_files(new_directory):
+        if new_directory != '':
+            self.load_folder(new_directory, date_range)
+
+    def load_folder(self, new_directory, date_range=None):
+
+        """ Starts loading data from a folder in the background (if it has any data files)
+        Args:
+        new_directory : The folder to load
+        date_range : Optional (start, end) dates to load (either can be None)
+        """
+
+        # pandas is only needed (and so only imported) once a folder is opened
+        import datamanager #pylint: disable=import-outside-toplevel
+
+        if datamanager.DataManager.directory_has_data_files(new_directory):
             get_module_logger().info("Parsing directory %s", new_directory)
 
             self.configmanager.load_dataset_config(new_directory)
 
-            self.gui.reset_and_show_progress_bar("Loading from folder '%s'" % new_directory)
+            progress_text = "Loading from folder '%s'" % new_directory
+            if date_range is not None:
+                progress_text += " (%s to %s)" % tuple("..." if day is None else day for day in date_range)
+            self.gui.reset_and_show_progress_bar(progress_text)
 
+            # The new data manager only replaces the current one once it has finished loading
             self.msg_queue = queue.Queue()
-            self.data_manager = DataManager(self.msg_queue, new_directory, self.configmanager)
-            self.data_manager.start()
+            (cache_budget, spill_dir) = get_column_cache_settings(self.configmanager)
+            self.loading_data_manager = datamanager.DataManagerThread(
+                self.msg_queue, new_directory, self.configmanager, cache_budget, spill_dir,
+                get_folder_manifest(self.configmanager, new_directory), date_range,
+                get_load_options(self.configmanager))
+            self.loading_data_manager.start()
 
-            self.loading_timer = threading.Timer(0.1, self.check_data_manager_status)
-            self.loading_timer.start()
+            self.gui.schedule(PROGRESS_POLL_MS, self.check_data_manager_status)
 
     def check_data_manager_status(self):
 
-        """ When the data manager is loading new data, updates the progress bar """
+        """
+        When the data manager is loading new data, updates the progress bar.
+        This runs on the Tk main loop. Every pending message is handled on each call,
+        but the progress bar is only updated once, with the latest progress event.
+        """
 
-        dataloader_finished = False
-        try:
-            msg = self.msg_queue.get(0)
-            if msg == EVT_DATA_LOAD_COMPLETE:
+        import datamanager #pylint: disable=import-outside-toplevel
+
+        # Checked before draining the queue, so any final messages are seen before giving up
+        dataloader_alive = self.loading_data_manager.is_alive()
+
+        progress = None
+        while True:
+            try:
+                msg = self.msg_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if msg == datamanager.EVT_DATA_LOAD_COMPLETE:
                 self.gui.set_progress_text("Processing data...")
-                self.gui.set_progress_percent(0)
-            elif msg == EVT_DATA_PROCESSING_COMPLETE:
+            elif msg == datamanager.EVT_DATA_PROCESSING_COMPLETE:
                 # Data has finished loading.
-                dataloader_finished = True
+                self.data_manager = self.loading_data_manager.data_manager
+                self.loading_data_manager = None
                 self.gui.hide_progress_bar()
                 self.plot_datasets()
+                self.check_memory_budget()
+                return
+            elif msg == datamanager.EVT_DATA_LOAD_CANCELLED:
+                self.end_cancelled_load()
+                return
+            elif msg == datamanager.EVT_DATA_NOT_IN_RANGE:
+                self.end_cancelled_load()
+                show_info_dialog("There is no data in the folder in the date range")
+                return
             else:
-                self.gui.set_progress_percent(msg)
-        except queue.Empty:
-            pass
-        except:
-            raise
+                progress = msg # A ProgressEvent
+
+        if progress is not None:
+            self.gui.set_progress_percent(progress.percent)
+            self.gui.set_progress_details(describe_progress(progress))
+
+        if dataloader_alive:
+            self.gui.schedule(PROGRESS_POLL_MS, self.check_data_manager_status)
+        else:
+            # The data manager stopped without completing (the error is in its thread's traceback)
+            self.end_cancelled_load()
+            show_info_dialog("Could not load data - check that the folder contains valid CSV files")
+
+    def action_cancel_load(self, keep_partial):
+
+        """ Handles request to cancel loading data
+        Args:
+        keep_partial : If True, the data loaded so far is shown. Otherwise it is discarded.
+        """
+
+        if self.loading_data_manager is not None:
+            get_module_logger().info("Cancelling data load (keep partial data: %s)", keep_partial)
+            self.gui.set_progress_text("Stopping...")
+            self.loading_data_manager.cancel(keep_partial)
+
+    def end_cancelled_load(self):
+
+        """ Tidies up after a load that did not complete. Any previously loaded data stays displayed. """
 
-        if not dataloader_finished:
-            self.loading_timer = threading.Timer(0.1, self.check_data_manager_status)
-            self.loading_timer.start()
+        self.loading_data_manager = None
+        self.gui.hide_progress_bar()
 
+        # The dataset config was replaced when loading started, so restore the previous one
+        if self.data_manager is not None:
+            self.configmanager.load_dataset_config(self.data_manager.folder)
+
+    @timing.timed
     def action_special_option(self):
 
         """ Handles requests for special options
@@ -275,75 +722,312 @@ class Application:
 
         action = self.gui.get_special_action()
 
-        if action == "Windrose":
+        try:
+            (start, end) = [parse_date(text) for text in self.gui.get_special_date_range()]
+        except ValueError:
+            show_info_dialog("Could not read date range - dates must be in YYYY-MM-DD format")
+            return
 
-            get_module_logger().info("Plotting windrose")
-            self.gui.add_new_window('Windrose', (7, 6))
+        # With no date range of its own, the special option uses the range shown on the plots
+        start = self.view_range[0] if start is None else start
+        end = self.view_range[1] if end is None else end
+
+        data_manager = self.data_manager
 
-            # Get the wind direction and speed data
-            speed = self.data_manager.get_dataset('Wind Speed')
-            direction = self.data_manager.get_dataset('Direction')
+        if action == "Windrose":
 
-            self.windplotter.set_data(speed, direction)
+            get_module_logger().info("Plotting windrose")
 
-            # Add window and axes to the GUI
-            try:
-                self.gui.draw(self.windplotter, 'Windrose')
-            except Exception as exc: #pylint: disable=broad-except
+            def show_windrose(wind_table):
+                """ Add window and axes to the GUI and plot the windrose """
+                self.gui.add_new_window('Windrose', (7, 6))
+                try:
+                    self.windplotter.set_wind_histogram(wind_table)
+                    self.gui.draw_now(self.windplotter, 'Windrose')
+                except Exception as exc: #pylint: disable=broad-except
+                    windrose_error(exc)
+
+            def windrose_error(exc):
+                """ Tell the user the windrose could not be plotted """
                 get_module_logger().info("Could not plot windrose (%s)", exc)
                 show_info_dialog(
                     "Could not plot windrose - check that the windspeed and direction data are valid")
 
+            # Get the windrose table for the date range (precomputed per day by the data manager)
+            self.submit_work(
+                "windrose", lambda: data_manager.get_windrose_table(start, end), show_windrose, windrose_error)
+
         elif action == "Histogram":
             get_module_logger().info("Plotting histogram")
-            self.gui.add_new_window('Histogram', (7, 6))
 
-            # Get the data for the histogram
             dataset_name = self.gui.get_selected_dataset_name()
-            speed = self.data_manager.get_dataset(dataset_name)
-
-            self.histogram.set_data(speed, dataset_name)
-
-            # Add window and axes to the GUI
-            self.gui.draw(self.histogram, 'Histogram')
 
+            def show_histogram(result):
+                """ Add window and axes to the GUI and plot the histogram """
+                (counts, edges) = result
+                self.gui.add_new_window('Histogram', (7, 6))
+                self.histogram.set_counts(counts, edges, dataset_name)
+                self.gui.draw(self.histogram, 'Histogram')
+
+            def histogram_error(exc):
+                """ Tell the user the histogram could not be plotted """
+                get_module_logger().info("Could not plot histogram (%s)", exc)
+                show_info_dialog("Could not plot histogram for %s" % dataset_name)
+
+            # Get the precomputed histogram counts for the date range
+            self.submit_work(
+                "histogram", lambda: data_manager.get_histogram(dataset_name, start, end), show_histogram,
+                histogram_error)
+
+    def check_memory_budget(self):
+
+        """ Warns the user if the loaded data uses more memory than the configured budget """
+
+        budget = get_memory_budget(self.configmanager)
+        if budget is None:
+            return
+
+        report = self.data_manager.memory_report()
+        if report.total > budget:
+            get_module_logger().warning(
+                "Loaded data uses %.0f MB (budget %.0f MB)", report.total / 1e6, budget / 1e6)
+            show_info_dialog(
+                "Loaded data uses %.0f MB, which is over the memory budget of %.0f MB.\n"
+                "See the Diagnostics window for the memory used by each field." % (report.total / 1e6, budget / 1e6))
+
+    def show_diagnostics(self):
+
+        """ Shows the diagnostics window: a summary of recorded stage timings and memory used by loaded data """
+
+        if timing.is_enabled():
+            text = "\n".join(timing.summarise(timing.get_spans()))
+            toggle_text = "Disable timing"
+        else:
+            text = "Timing is disabled. Enable it here, or start the application with --timing."
+            toggle_text = "Enable timing"
+
+        if self.data_manager is not None:
+            import datamanager #pylint: disable=import-outside-toplevel
+            memory_lines = datamanager.summarise_memory(
+                self.data_manager.memory_report(), get_memory_budget(self.configmanager))
+            text += "\n\nMemory used by loaded data:\n" + "\n".join(memory_lines)
+
+        if self.data_manager is not None and self.data_manager.manifest is not None:
+            from manifest import describe_summary #pylint: disable=import-outside-toplevel
+            text += "\n\nFolder: %s" % describe_summary(self.data_manager.manifest.summary())
+            changes = self.data_manager.folder_changes
+            if changes is not None:
+                text += "\nSince last load: %d new, %d changed, %d removed files" % (
+                    len(changes.added), len(changes.changed), len(changes.removed))
+
+        def toggle_timing():
+            """ Turn timing on/off and refresh the window """
+            timing.enable(not timing.is_enabled())
+            self.show_diagnostics()
+
+        def clear_timings():
+            """ Discard recorded timings and refresh the window """
+            timing.clear()
+            self.show_diagnostics()
+
+        self.gui.show_text_window("Diagnostics", text, [
+            (toggle_text, toggle_timing),
+            ("Clear timings", clear_timings),
+            ("Save timings as JSON", self.save_timings)])
+
+    def save_timings(self):
+
+        """ Asks for a filename and writes recorded timings to it as JSON """
+
+        filename = ask_save_filename("Save timings", ".json")
+        if filename != '':
+            timing.dump_json(filename)
+
+    @timing.timed
     def plot_datasets(self):
 
         """ Plots the default set of data (from configuration file) """
 
         self.plotter.clear_data()
 
-        # Get the default fields from config
-        default_fields = self.configmanager.get_global_config('DEFAULT', 'DefaultFields')
-        default_fields = [field.strip() for field in default_fields.split(",")]
+        # Results of any work for the previous data are no longer wanted
+        self.cancel_work()
 
-        # Drawing mutiple plots, so turn off drawing until all three are processed
-        self.plotter.suspend_draw(True)
+        for index, display_name in enumerate(get_default_display_names(self.configmanager, self.data_manager)):
+            self.set_subplot_dataset(index, display_name)
 
-        field_count = 0
-        numeric_fields = self.data_manager.get_numeric_field_names()
-        for field in default_fields:
-            if field in numeric_fields:
-                display_name = self.data_manager.get_display_name(field)
-                self.action_subplot_change(field_count, display_name)
-                field_count += 1
+        # Now the plots can be drawn (once, however many subplots were changed)
+        self.gui.set_dataset_choices(self.data_manager.get_numeric_display_names())
+        self.gui.draw(self.plotter)
+
+def save_figure(plotter, size, styles, path_base, formats):
+    """
+    Draws a plotter on a new Agg figure and saves it in each requested format
+    Args:
+    plotter: The plotter object that will do the drawing
+    size: (x, y) tuple of figure size in inches
+    styles: The plotting styles for each subplot
+    path_base: The path to save to, without extension
+    formats: List of file extensions (e.g. "png", "svg", "pdf")
+    """
+    #pylint: disable=import-outside-toplevel
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=size, dpi=100)
+    FigureCanvasAgg(fig)
+    plotter.draw(fig, styles)
+    for file_format in formats:
+        fig.savefig("%s.%s" % (path_base, file_format))
+
+def safe_filename(name):
+    """ Returns a name with any character that is not a letter, digit, "-", "_" or "." replaced by "_",
+    so it can be used as a file or folder name on any platform """
+    return "".join(char if char.isalnum() or char in "-_." else "_" for char in name)
+
+def get_output_names(folders):
+    """
+    Returns a unique output subfolder name for each of a list of data folders.
+    Each name is the folder's path relative to the folders' common parent (so siteA/2023 and siteB/2023
+    become siteA_2023 and siteB_2023). A name that is still used more than once gets a numbered suffix.
+    Args:
+    folders: List of data folders
+    """
+    paths = [os.path.normpath(os.path.abspath(folder)).split(os.sep) for folder in folders]
 
-        # If field count is less than 3, fill the rest of the plots in order from datasets
-        for field in numeric_fields:
-            if field_count == 3:
-                break # No more fields to add
+    # Drop the path components common to every folder, but always keep each folder's own name
+    common = min(len(os.path.commonprefix(paths)), min(len(path) for path in paths) - 1)
 
-            if field in default_fields:
-                continue # Already added, move onto next field
+    names = [safe_filename("_".join(path[common:])) for path in paths]
 
-            display_name = self.data_manager.get_display_name(field)
-            self.action_subplot_change(field_count, display_name)
-            field_count += 1
+    used = set()
+    unique_names = []
+    for name in names:
+        unique_name = name
+        suffix = 2
+        while unique_name in used:
+            unique_name = "%s_%d" % (name, suffix)
+            suffix += 1
+        used.add(unique_name)
+        unique_names.append(unique_name)
 
-        # Now the plots can be drawn
-        self.gui.set_dataset_choices(self.data_manager.get_numeric_display_names())
-        self.plotter.suspend_draw(False)
-        self.gui.draw(self.plotter)
+    return unique_names
+
+def render_folder(folder, output_dir, formats, date_range=None):
+    """
+    Loads a data folder and renders its standard plots (main plots, windrose, histograms)
+    to image files without any GUI. Runs in a batch worker process.
+    Returns (folder, timings, error), where timings is a dict of stage name to seconds
+    and error is None on success.
+    Args:
+    folder: The data folder to load
+    output_dir: The folder to write this data folder's plots to (see get_output_names)
+    formats: List of file extensions (e.g. "png", "svg", "pdf")
+    date_range: Optional (start, end) dates to load (either can be None)
+    """
+    #pylint: disable=import-outside-toplevel
+    # Batch workers may have no display: select Agg before plotter or windrose import pylab
+    import matplotlib
+    matplotlib.use("Agg")
+
+    from datamanager import DataManager
+
+    timings = OrderedDict()
+    start_time = time.time()
+    stage_time = start_time
+
+    try:
+        configmanager = ConfigManager(".")
+        configmanager.load_dataset_config(folder)
+
+        (cache_budget, spill_dir) = get_column_cache_settings(configmanager)
+        # Folders are already rendered in parallel processes, so files are not parsed by more processes
+        load_options = get_load_options(configmanager)._replace(split_bytes=None, parse_processes=1)
+        data_manager = DataManager(
+            folder, configmanager, cache_budget, spill_dir, get_folder_manifest(configmanager, folder),
+            date_range, load_options).load()
+
+        timings["load"] = time.time() - stage_time
+        stage_time = time.time()
+
+        os.makedirs(output_dir, exist_ok=True)
+
+        plotter = Plotter(configmanager)
+        display_names = get_default_display_names(configmanager, data_manager)
+        for index, display_name in enumerate(display_names):
+            plotter.set_visibility(index, True)
+            plotter.set_dataset(
+                data_manager.get_timestamps(display_name), data_manager.get_dataset(display_name),
+                display_name, index)
+
+        display_names += [None] * (3 - len(display_names))
+        styles = [get_plotting_style(configmanager, data_manager, name) for name in display_names]
+        save_figure(plotter, (8, 5), styles, os.path.join(output_dir, "plots"), formats)
+
+        timings["plots"] = time.time() - stage_time
+        stage_time = time.time()
+
+        if data_manager.daily_wind_table is not None:
+            windplotter = WindPlotter(configmanager)
+            windplotter.set_wind_histogram(data_manager.get_windrose_table())
+            save_figure(windplotter, (7, 6), None, os.path.join(output_dir, "windrose"), formats)
+
+        timings["windrose"] = time.time() - stage_time
+        stage_time = time.time()
+
+        histogram = Histogram()
+        for display_name in data_manager.get_numeric_display_names():
+            if "Histogram" in (data_manager.get_special_dataset_options(display_name) or []):
+                (counts, edges) = data_manager.get_histogram(display_name)
+                histogram.set_counts(counts, edges, display_name)
+                save_figure(
+                    histogram, (7, 6), None,
+                    os.path.join(output_dir, "histogram_%s" % safe_filename(display_name)), formats)
+
+        timings["histograms"] = time.time() - stage_time
+        error = None
+
+    except Exception as exc: #pylint: disable=broad-except
+        # Report the failure in the summary rather than stopping the other folders
+        error = "%s: %s" % (type(exc).__name__, exc)
+
+    timings["total"] = time.time() - start_time
+    return (folder, timings, error)
+
+def run_batch(folders, output_dir, formats, jobs=None, date_range=None):
+    """
+    Renders plots for a list of data folders in parallel worker processes,
+    then prints a per-folder timing summary.
+    Returns the number of folders that failed.
+    Args:
+    folders: List of data folders
+    output_dir: The folder to write plots to
+    formats: List of file extensions (e.g. "png", "svg", "pdf")
+    jobs: Number of worker processes (None for one per CPU)
+    date_range: Optional (start, end) dates to load from each folder
+    """
+
+    get_module_logger().info("Rendering %d folders to %s", len(folders), output_dir)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(render_folder, folder, os.path.join(output_dir, name), formats, date_range)
+            for (folder, name) in zip(folders, get_output_names(folders))]
+        results = [future.result() for future in futures]
+
+    stages = ["load", "plots", "windrose", "histograms", "total"]
+    print("%-40s" % "Folder" + "".join("%12s" % stage for stage in stages))
+
+    failures = 0
+    for (folder, timings, error) in results:
+        times = "".join(("%12.2f" % timings[stage]) if stage in timings else "%12s" % "-" for stage in stages)
+        print("%-40s%s" % (folder, times))
+        if error is not None:
+            failures += 1
+            print("    FAILED: %s" % error)
+
+    print("%d folders rendered, %d failed" % (len(results) - failures, failures))
+    return failures
 
 def main():
 
@@ -353,16 +1037,31 @@ def main():
 
     get_module_logger().setLevel(logging.INFO)
 
+    multiprocessing.freeze_support() # Allows batch worker processes in the frozen executable
+
     arg_parser = get_arg_parser()
     args = arg_parser.parse_args()
 
-    # The call to run() does not return.
+    timing.enable(args.timing or args.timing_file is not None)
+
+    if args.batch_folders is not None:
+        # Headless batch rendering: no GUI is created
+        sys.exit(run_batch(
+            args.batch_folders, args.output_dir, args.formats, args.jobs, get_date_range(args.load_from, args.load_to)))
+
+    # The call to run_gui() does not return until the user exits.
     # All events are handled via GUI handlers and application callbacks.
 
-    _ = Application(args)
+    app = Application(args)
 
     run_gui()
 
+    # Do not start any computation the user is no longer waiting for
+    app.shutdown_work()
+
+    if args.timing_file is not None:
+        timing.dump_json(args.timing_file)
+
 if __name__ == "__main__":
     main()
 
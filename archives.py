@@ -0,0 +1,78 @@
+"""
+archives.py
+
+@author: James Fowkes
+
+Reading compressed logger data without extracting it to disk.
+
+Supported files are gzip (.csv.gz) and bzip2 (.csv.bz2) compressed CSV files,
+and zip archives (.zip) of CSV files. Each is read as a stream of decompressed bytes,
+so it can be passed straight to the CSV parser.
+"""
+
+import io
+import bz2
+import gzip
+import zipfile
+
+# Extensions of compressed data files
+COMPRESSED_EXTENSIONS = (".csv.gz", ".csv.bz2", ".zip")
+
+# Errors raised when a compressed file is not valid
+ARCHIVE_ERRORS = (OSError, EOFError, zipfile.BadZipFile)
+
+def is_compressed(filename):
+    """ Returns True if the filename has one of the COMPRESSED_EXTENSIONS (in any case) """
+    return filename.lower().endswith(COMPRESSED_EXTENSIONS)
+
+def is_zip(filename):
+    """ Returns True if the filename is a zip archive """
+    return filename.lower().endswith(".zip")
+
+def member_names(path):
+    """
+    Returns the names of the CSV members of a zip archive, in name order
+    ([None] for any other file, which has one stream of data)
+    Args:
+    path: The data file
+    """
+    if not is_zip(path):
+        return [None]
+
+    with zipfile.ZipFile(path) as archive:
+        return sorted(name for name in archive.namelist() if name.lower().endswith(".csv"))
+
+def open_member(path, member=None, data=None):
+    """
+    Returns a binary file object of the decompressed bytes of a data file (or one member of a zip archive).
+    Uncompressed files are opened as they are.
+    Args:
+    path: The data file
+    member: The member name (from member_names) for a zip archive
+    data: The file's (compressed) bytes if they have already been read, or None to read the file
+    """
+    source = path if data is None else io.BytesIO(data)
+    lower_path = path.lower()
+
+    if lower_path.endswith(".gz"):
+        return gzip.GzipFile(fileobj=source) if data is not None else gzip.GzipFile(path)
+    elif lower_path.endswith(".bz2"):
+        return bz2.BZ2File(source)
+    elif is_zip(path):
+        # The member keeps the archive's file open until the member is closed
+        with zipfile.ZipFile(source) as archive:
+            return archive.open(member)
+    else:
+        return open(path, "rb") if data is None else source
+
+def read_first_line(path):
+    """
+    Returns the first line (as bytes) of a data file, decompressing only as much as is needed.
+    For a zip archive, the first line of its first CSV member is returned.
+    """
+    members = member_names(path)
+    if not members:
+        return b"" # A zip archive with no CSV files
+
+    with open_member(path, members[0]) as data_file:
+        return data_file.readline()
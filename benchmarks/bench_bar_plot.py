@@ -0,0 +1,90 @@
+"""
+bench_bar_plot.py
+
+@author: James Fowkes
+
+Compares render time of the "bar" plotting style using the old per-sample
+Rectangle bars (axis.bar) against the single collection used by Plotter.draw.
+
+Usage: python benchmarks/bench_bar_plot.py [--sizes 1000 10000 100000]
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import matplotlib
+matplotlib.use('Agg')
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+#pylint: disable=wrong-import-position
+from configmanager import ConfigManager
+from plotter import Plotter
+
+def get_arg_parser():
+    """ Return a command line argument parser for this script """
+    arg_parser = argparse.ArgumentParser(description='Bar plot render benchmark')
+
+    arg_parser.add_argument(
+        '--sizes', dest='sizes', nargs='+', type=int, default=[1000, 10000, 100000],
+        help="Number of samples to plot")
+
+    arg_parser.add_argument(
+        '--skip_old', dest='skip_old', action='store_true',
+        help="Do not time the old per-sample bar path (it is very slow for large sizes)")
+
+    return arg_parser
+
+def make_data(size):
+    """ Returns (times, data) for a 30 second logging interval """
+    times = np.datetime64('2015-01-01T00:00:00') + np.arange(size) * np.timedelta64(30, 's')
+    data = np.abs(np.random.randn(size)) * 10
+    return times, data
+
+def time_old_path(times, data):
+    """ Render using one Rectangle per sample, as Plotter.draw used to """
+    fig = Figure(figsize=(8, 5), dpi=100)
+    canvas = FigureCanvasAgg(fig)
+    axis = fig.add_subplot(1, 1, 1)
+
+    start = time.perf_counter()
+    axis.bar(times.astype(object), data, align="center", width=(10/86400), color='b', edgecolor='b')
+    fig.autofmt_xdate()
+    canvas.draw()
+    return time.perf_counter() - start
+
+def time_new_path(times, data):
+    """ Render using Plotter.draw with the bar style """
+    fig = Figure(figsize=(8, 5), dpi=100)
+    canvas = FigureCanvasAgg(fig)
+
+    plotter = Plotter(ConfigManager(BENCHMARK_DIR)) # No config.ini here, so no units are applied
+    plotter.set_dataset(times, data, "Data", 0)
+    plotter.set_visibility(0, True)
+
+    start = time.perf_counter()
+    plotter.draw(fig, [["bar", "b"], None, None])
+    canvas.draw()
+    return time.perf_counter() - start
+
+def main():
+    """ Run the benchmark and print a results table """
+    args = get_arg_parser().parse_args()
+
+    print("%10s %12s %12s" % ("Samples", "Old (s)", "New (s)"))
+    for size in args.sizes:
+        times, data = make_data(size)
+        old_time = "-" if args.skip_old else "%.3f" % time_old_path(times, data)
+        new_time = "%.3f" % time_new_path(times, data)
+        print("%10d %12s %12s" % (size, old_time, new_time))
+
+if __name__ == "__main__":
+    main()
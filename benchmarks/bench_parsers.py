@@ -0,0 +1,143 @@
+"""
+bench_parsers.py
+
+@author: James Fowkes
+
+Compares the CSV parser backends (see parsers.py) on a data folder, so the fastest
+can be chosen for the [LOADING] Parser setting in config.ini:
+
+    python benchmarks/bench_parsers.py --generate 100MB
+    python benchmarks/bench_parsers.py --folder DATA_FOLDER --repeat 3
+
+Each parser reads every data file in the folder (fastest of --repeat runs).
+The table shows its throughput, how many files it could not read itself (and so fell back to pandas),
+and whether its dataframes are the same as those from pandas.
+"""
+
+import os
+import sys
+import time
+import datetime
+import shutil
+import argparse
+import tempfile
+
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APPLICATION_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, APPLICATION_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+#pylint: disable=wrong-import-position
+import parsers
+from archives import open_member, member_names
+from datamanager import get_csv_filenames
+import generate_dataset
+
+def get_arg_parser():
+    """ Return a command line argument parser for this script """
+    arg_parser = argparse.ArgumentParser(description='CSV parser backend benchmark')
+
+    dataset = arg_parser.add_mutually_exclusive_group(required=True)
+    dataset.add_argument('--folder', dest='folder', help="Existing data folder to benchmark")
+    dataset.add_argument(
+        '--generate', dest='generate', metavar='SIZE',
+        help="Generate a synthetic dataset of this size (e.g. 100MB) in a temporary folder and benchmark it")
+
+    arg_parser.add_argument(
+        '--repeat', dest='repeat', type=int, default=1,
+        help="Number of timed runs of each parser (the fastest is reported)")
+
+    arg_parser.add_argument(
+        '--parsers', dest='parsers', nargs='+', default=parsers.PARSER_NAMES, choices=parsers.PARSER_NAMES,
+        help="Parsers to compare")
+
+    return arg_parser
+
+def get_sources(folder):
+    """ Returns a list of (name, function returning a new binary file object) for each CSV file in a folder """
+    sources = []
+    for filename in sorted(get_csv_filenames(folder)):
+        path = os.path.join(folder, filename)
+        for member in member_names(path):
+            name = filename if member is None else "%s/%s" % (filename, member)
+            sources.append((name, lambda path=path, member=member: open_member(path, member)))
+    return sources
+
+def count_fallbacks(parser, sources):
+    """ Returns the number of sources a parser cannot read by itself """
+    if parser not in parsers.WHOLE_FILE_PARSERS:
+        return 0
+
+    fallbacks = 0
+    for (name, open_source) in sources:
+        try:
+            with open_source() as data_file:
+                parsers.WHOLE_FILE_PARSERS[parser](data_file)
+        except (ValueError, TypeError, IndexError, ImportError) as exc:
+            print("%s cannot read %s (%s)" % (parser, name, exc))
+            fallbacks += 1
+    return fallbacks
+
+def matches(frames, reference_frames):
+    """ Returns True if two lists of dataframes have the same timestamps, columns and values """
+    try:
+        for (frame, reference) in zip(frames, reference_frames):
+            pd.testing.assert_frame_equal(frame, reference, check_dtype=False)
+    except AssertionError:
+        return False
+    return len(frames) == len(reference_frames)
+
+def run_parser(parser, sources, repeat):
+    """ Parses every source and returns (dataframes, fastest time in seconds) """
+    frames = None
+    fastest = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frames = [parsers.parse(open_source, parser) for (_, open_source) in sources]
+        elapsed = time.perf_counter() - start
+        fastest = elapsed if fastest is None else min(fastest, elapsed)
+    return frames, fastest
+
+def run_benchmarks(folder, parser_names, repeat):
+    """
+    Times each parser on a folder and prints the results table
+    Args:
+    folder: The data folder
+    parser_names: The parsers to compare
+    repeat: Number of timed runs of each parser
+    """
+    sources = get_sources(folder)
+    total_bytes = sum(os.path.getsize(os.path.join(folder, filename)) for filename in get_csv_filenames(folder))
+
+    (reference_frames, _) = run_parser(parsers.DEFAULT_PARSER, sources, 1)
+    rows = sum(len(frame) for frame in reference_frames)
+    print("%d files, %d rows, %.1f MB on disk" % (len(sources), rows, total_bytes / 1e6))
+
+    print("%-10s %10s %10s %14s %10s %8s" % ("Parser", "Time (s)", "MB/s", "Rows/s", "Fallbacks", "Matches"))
+    for parser in parser_names:
+        (frames, seconds) = run_parser(parser, sources, repeat)
+        print("%-10s %10.3f %10.1f %14d %10d %8s" % (
+            parser, seconds, total_bytes / 1e6 / seconds, rows / seconds, count_fallbacks(parser, sources),
+            "yes" if matches(frames, reference_frames) else "NO"))
+
+def main():
+    """ Run the benchmark from the command line arguments """
+    args = get_arg_parser().parse_args()
+
+    folder = args.folder
+    if args.generate is not None:
+        folder = tempfile.mkdtemp(prefix="csvviewer_parsers_")
+        generate_dataset.generate(
+            folder, generate_dataset.parse_size(args.generate), generate_dataset.parse_size("10MB"),
+            30, datetime.datetime(2015, 1, 1), "CSV01", 0)
+
+    try:
+        run_benchmarks(folder, args.parsers, args.repeat)
+    finally:
+        if args.generate is not None:
+            shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    main()
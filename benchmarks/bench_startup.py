@@ -0,0 +1,137 @@
+"""
+bench_startup.py
+
+@author: James Fowkes
+
+Measures application startup time:
+ - time to first window: from starting Python until the main window is shown
+ - time to first plot: from starting Python until the main figure has been drawn for a data folder
+
+Each run is a fresh Python process, so imports are cold (as they are for users).
+The modules already imported when the window appears are also reported,
+to check that pandas, matplotlib and windrose are not loaded before they are needed.
+
+Needs a display. Usage: python benchmarks/bench_startup.py [--folder DATA_FOLDER] [--runs 5]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+# Taken as early as possible, to include the interpreter's own import time
+SCRIPT_START = time.perf_counter()
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APPLICATION_DIR = os.path.dirname(BENCHMARK_DIR)
+
+# Modules that should not be imported before the window appears
+DEFERRED_MODULES = ["pandas", "matplotlib", "pylab", "windrose"]
+
+# Give up waiting for the first plot after this long
+PLOT_TIMEOUT_S = 300
+
+def get_arg_parser():
+    """ Return a command line argument parser for this script """
+    arg_parser = argparse.ArgumentParser(description='Application startup benchmark')
+
+    arg_parser.add_argument(
+        '--folder', dest='folder', default=None,
+        help="Data folder to load for the time to first plot (if not given, only the window is timed)")
+
+    arg_parser.add_argument(
+        '--runs', dest='runs', type=int, default=5,
+        help="Number of times to start the application")
+
+    arg_parser.add_argument(
+        '--single_run', dest='single_run', action='store_true',
+        help=argparse.SUPPRESS) # Used internally: time one startup and print the results as JSON
+
+    return arg_parser
+
+def single_run(folder):
+    """
+    Starts the application in this process, waits for the first window (and plot if a folder is given),
+    then prints the results as JSON
+    Args:
+    folder: Data folder to load, or None
+    """
+    sys.path.insert(0, APPLICATION_DIR)
+    os.chdir(APPLICATION_DIR) # The application looks for its config in the working directory
+
+    import application #pylint: disable=import-outside-toplevel
+
+    args = application.get_arg_parser().parse_args(
+        [] if folder is None else ["--start_folder", folder])
+
+    app = application.Application(args)
+    root = app.gui.root
+
+    # Process events until the window is mapped, as the main loop would
+    while not root.winfo_viewable():
+        root.update()
+
+    results = {
+        "first_window":time.perf_counter() - SCRIPT_START,
+        "modules_at_first_window":[name for name in DEFERRED_MODULES if name in sys.modules]}
+
+    if folder is not None:
+        while app.gui.get_render_count('Main') == 0:
+            if time.perf_counter() - SCRIPT_START > PLOT_TIMEOUT_S:
+                break
+            root.update()
+            time.sleep(0.001)
+        else:
+            results["first_plot"] = time.perf_counter() - SCRIPT_START
+
+    app.shutdown_work()
+    root.destroy()
+
+    print(json.dumps(results))
+
+def run_once(folder):
+    """
+    Times one startup in a new Python process and returns its results dictionary
+    Args:
+    folder: Data folder to load, or None
+    """
+    command = [sys.executable, os.path.abspath(__file__), "--single_run"]
+    if folder is not None:
+        command += ["--folder", os.path.abspath(folder)]
+
+    output = subprocess.check_output(command, universal_newlines=True)
+
+    # Anything else written to stdout comes first, so the results are the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+def format_times(times):
+    """ Returns 'min / median / max' of a list of times in seconds """
+    if not times:
+        return "-"
+    times = sorted(times)
+    return "%.3f / %.3f / %.3f" % (times[0], times[len(times) // 2], times[-1])
+
+def main():
+    """ Run the benchmark and print the results """
+    args = get_arg_parser().parse_args()
+
+    if args.single_run:
+        single_run(args.folder)
+        return
+
+    results = [run_once(args.folder) for _ in range(args.runs)]
+
+    print("Startup times over %d runs (min / median / max, seconds)" % args.runs)
+    print("%-20s %s" % ("First window", format_times([result["first_window"] for result in results])))
+    if args.folder is not None:
+        print("%-20s %s" % (
+            "First plot", format_times([result["first_plot"] for result in results if "first_plot" in result])))
+
+    loaded = sorted(set(name for result in results for name in result["modules_at_first_window"]))
+    print("Imported before first window: %s" % (", ".join(loaded) if loaded else "none of %s" % (
+        ", ".join(DEFERRED_MODULES))))
+
+if __name__ == "__main__":
+    main()
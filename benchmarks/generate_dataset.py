@@ -0,0 +1,226 @@
+"""
+generate_dataset.py
+
+@author: James Fowkes
+
+Writes a synthetic datalogger folder for benchmarking, in the same layout as real logger data:
+
+    Reference,Date,Time,Wind Pulses,Direction,Temperature,Battery Voltage,Humidity
+    CSV01,01/01/15,00:00:30,74,NE,4.2,12.61,0.832
+
+ - Date is day first (dd/mm/yy) and split from Time, as the application expects
+ - Wind Pulses are anemometer pulses counted over each logging interval
+ - Direction is a cardinal point (N, NE, E...), optionally with some 'D' (disconnected) readings
+ - Humidity is a fraction from 0 to 1
+
+A matching config.txt (special fields and formatting) is written alongside the CSV files.
+Data is split into several CSV files, as a logger writes them.
+
+Usage: python benchmarks/generate_dataset.py OUTPUT_FOLDER --size 100MB [--file_size 10MB] [--interval 30]
+"""
+
+import os
+import datetime
+import argparse
+
+import numpy as np
+
+# Column header of every CSV file
+HEADER = "Reference,Date,Time,Wind Pulses,Direction,Temperature,Battery Voltage,Humidity\n"
+
+# Cardinal points in order of increasing angle (45 degrees apart)
+CARDINAL_POINTS = np.array(['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW'])
+
+# Anemometer calibration (m/s per pulse per second), as written to config.txt
+CALIBRATION_FACTOR = 0.7
+
+# Rows are generated and written in blocks of (at most) this many rows
+BLOCK_ROWS = 50000
+
+# Approximate length of one row of CSV text, used to avoid overshooting small sizes
+ROW_BYTES_ESTIMATE = 50
+
+CONFIG_TXT = """[SPECIAL FIELDS]
+Wind Pulses = WS, Wind Speed, %(calibration)s
+Direction = WD, Direction
+Humidity = HUM, Humidity
+
+[FORMATTING]
+Wind Pulses = bar, r
+Temperature = line, b
+Battery Voltage = line, g
+Humidity = line, c
+"""
+
+SIZE_UNITS = {"B":1, "KB":1e3, "MB":1e6, "GB":1e9, "TB":1e12}
+
+def parse_size(text):
+    """ Converts a size such as "500MB" or "20GB" to a number of bytes """
+    text = text.strip().upper()
+    for unit in sorted(SIZE_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(text)
+
+def get_arg_parser():
+    """ Return a command line argument parser for this script """
+    arg_parser = argparse.ArgumentParser(description='Synthetic datalogger dataset generator')
+
+    arg_parser.add_argument('output_folder', help="Folder to write the CSV files and config.txt to")
+
+    arg_parser.add_argument(
+        '--size', dest='size', default="10MB",
+        help="Approximate total size of the CSV files (e.g. 1MB, 500MB, 20GB)")
+
+    arg_parser.add_argument(
+        '--file_size', dest='file_size', default="10MB",
+        help="Approximate size of each CSV file")
+
+    arg_parser.add_argument(
+        '--interval', dest='interval', type=int, default=30,
+        help="Logging interval in seconds")
+
+    arg_parser.add_argument(
+        '--start', dest='start', default="2015-01-01",
+        help="Date of the first reading (YYYY-MM-DD)")
+
+    arg_parser.add_argument(
+        '--reference', dest='reference', default="CSV01",
+        help="Logger reference written in the first column")
+
+    arg_parser.add_argument(
+        '--disconnected', dest='disconnected', type=float, default=0.,
+        help="Fraction of direction readings that are 'D' (disconnected). "
+        "Note that any 'D' readings mean speed and direction no longer match, so no windrose can be drawn")
+
+    arg_parser.add_argument(
+        '--seed', dest='seed', type=int, default=0,
+        help="Random seed, so the same dataset can be generated again")
+
+    return arg_parser
+
+class LoggerSimulator:
+
+    """
+    Generates blocks of plausible logger readings.
+    Weather changes smoothly from block to block, so the data looks like a continuous record.
+    """
+
+    def __init__(self, start_time, interval, disconnected, rng):
+        """
+        Args:
+        start_time: datetime of the first reading
+        interval: Logging interval in seconds
+        disconnected: Fraction of direction readings that are 'D'
+        rng: numpy RandomState
+        """
+        self.time = np.datetime64(start_time, 's')
+        self.interval = interval
+        self.disconnected = disconnected
+        self.rng = rng
+        self.prevailing_direction = 225. # South westerly
+        self.battery = 12.6
+
+    def block(self, rows):
+        """
+        Returns (timestamps, pulses, directions, temperatures, battery voltages, humidities) for the next rows
+        Args:
+        rows: Number of readings to generate
+        """
+        times = self.time + np.arange(1, rows + 1) * np.timedelta64(self.interval, 's')
+        self.time = times[-1]
+
+        day_fraction = (times - times.astype('datetime64[D]')).astype(float) / 86400
+        year_fraction = (times.astype('datetime64[D]').astype(float) % 365.25) / 365.25
+
+        # Wind speed follows a Weibull distribution (as real wind does), gusting around a daily cycle
+        speeds = self.rng.weibull(2., rows) * (4. + 2. * np.sin(2 * np.pi * (day_fraction - 0.25)))
+        pulses = np.round(speeds * self.interval / CALIBRATION_FACTOR).astype(int)
+
+        # Direction wanders around a slowly changing prevailing direction
+        self.prevailing_direction += self.rng.normal(0, 20)
+        angles = self.prevailing_direction + np.cumsum(self.rng.normal(0, 3, rows)) + self.rng.normal(0, 30, rows)
+        directions = CARDINAL_POINTS[np.round((angles % 360) / 45).astype(int) % 8].astype(object)
+        directions[self.rng.random_sample(rows) < self.disconnected] = 'D'
+
+        temperatures = (
+            10. - 8. * np.cos(2 * np.pi * year_fraction)
+            - 5. * np.cos(2 * np.pi * day_fraction) + self.rng.normal(0, 0.5, rows))
+
+        # Battery discharges overnight and is charged by a solar panel during the day
+        charge = np.where((day_fraction > 0.3) & (day_fraction < 0.7), 0.0004, -0.0002)
+        battery = np.clip(self.battery + np.cumsum(charge) * self.interval / 30, 11.5, 13.8)
+        self.battery = battery[-1]
+
+        humidities = np.clip(0.75 - 0.02 * (temperatures - 10.) + self.rng.normal(0, 0.05, rows), 0.05, 1.)
+
+        return times, pulses, directions, temperatures, battery, humidities
+
+def format_rows(reference, block):
+    """ Returns the CSV text of a block of readings """
+    (times, pulses, directions, temperatures, battery, humidities) = block
+
+    lines = []
+    for (timestamp, pulse_count, direction, temperature, voltage, humidity) in zip(
+            np.datetime_as_string(times), pulses, directions, temperatures, battery, humidities):
+        # timestamp is "YYYY-MM-DDTHH:MM:SS": the logger writes "DD/MM/YY,HH:MM:SS"
+        lines.append("%s,%s/%s/%s,%s,%d,%s,%.1f,%.2f,%.3f\n" % (
+            reference, timestamp[8:10], timestamp[5:7], timestamp[2:4], timestamp[11:19],
+            pulse_count, direction, temperature, voltage, humidity))
+
+    return "".join(lines)
+
+def generate(output_folder, total_bytes, file_bytes, interval, start, reference, seed, disconnected=0.): #pylint: disable=too-many-arguments
+    """
+    Writes the dataset and returns (files written, rows written, bytes written)
+    Args:
+    output_folder: Folder to write to (created if needed)
+    total_bytes: Approximate total size of the CSV files
+    file_bytes: Approximate size of each CSV file
+    interval: Logging interval in seconds
+    start: datetime of the first reading
+    reference: Logger reference written in the first column
+    seed: Random seed
+    disconnected: Fraction of direction readings that are 'D'
+    """
+    os.makedirs(output_folder, exist_ok=True)
+
+    with open(os.path.join(output_folder, "config.txt"), "w") as config_file:
+        config_file.write(CONFIG_TXT % {"calibration":CALIBRATION_FACTOR})
+
+    simulator = LoggerSimulator(start, interval, disconnected, np.random.RandomState(seed))
+
+    (file_count, row_count, bytes_written) = (0, 0, 0)
+    while bytes_written < total_bytes:
+        file_count += 1
+        path = os.path.join(output_folder, "LOG%05d.CSV" % file_count)
+        with open(path, "w") as csv_file:
+            csv_file.write(HEADER)
+            file_written = len(HEADER)
+
+            while file_written < file_bytes and bytes_written + file_written < total_bytes:
+                remaining = min(file_bytes - file_written, total_bytes - bytes_written - file_written)
+                rows = int(min(BLOCK_ROWS, max(1, remaining // ROW_BYTES_ESTIMATE)))
+
+                text = format_rows(reference, simulator.block(rows))
+                csv_file.write(text)
+                file_written += len(text)
+                row_count += rows
+
+        bytes_written += file_written
+        print("Wrote %s (%.1f MB, %.1f MB total)" % (path, file_written / 1e6, bytes_written / 1e6))
+
+    return file_count, row_count, bytes_written
+
+def main():
+    """ Generate a dataset from the command line arguments """
+    args = get_arg_parser().parse_args()
+
+    (files, rows, byte_count) = generate(
+        args.output_folder, parse_size(args.size), parse_size(args.file_size), args.interval,
+        datetime.datetime.strptime(args.start, "%Y-%m-%d"), args.reference, args.seed, args.disconnected)
+
+    print("%d rows in %d files (%.1f MB)" % (rows, files, byte_count / 1e6))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+run_benchmarks.py
+
+@author: James Fowkes
+
+End-to-end benchmark of the data path, with no GUI:
+ - load: DataManager.load (with its read, concat, convert etc. stages broken out from timing spans)
+ - get_dataset_average: one hour averages of a dataset
+ - windrose.histogram: windrose table of the wind speed and direction
+ - Plotter.draw: drawing the default plots on an Agg canvas
+
+Each stage is timed (fastest of --repeat runs) and its peak memory is recorded with tracemalloc
+(in a separate run, so tracing does not slow the timed runs).
+
+Results can be saved as a baseline and later runs compared against it:
+
+    python benchmarks/run_benchmarks.py --generate 100MB --save_baseline baseline.json
+    python benchmarks/run_benchmarks.py --generate 100MB --baseline baseline.json
+
+When comparing, the exit status is 1 if any stage is slower or uses more memory than the tolerance allows.
+"""
+
+import os
+import sys
+import json
+import time
+import datetime
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from collections import OrderedDict
+
+import matplotlib
+matplotlib.use('Agg')
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+APPLICATION_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, APPLICATION_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+#pylint: disable=wrong-import-position
+from configmanager import ConfigManager
+from datamanager import DataManager
+from plotter import Plotter
+from application import get_default_display_names, get_plotting_style
+import windrose
+import timing
+import generate_dataset
+
+def get_arg_parser():
+    """ Return a command line argument parser for this script """
+    arg_parser = argparse.ArgumentParser(description='CSV viewer data path benchmarks')
+
+    dataset = arg_parser.add_mutually_exclusive_group(required=True)
+    dataset.add_argument('--folder', dest='folder', help="Existing data folder to benchmark")
+    dataset.add_argument(
+        '--generate', dest='generate', metavar='SIZE',
+        help="Generate a synthetic dataset of this size (e.g. 100MB) in a temporary folder and benchmark it")
+
+    arg_parser.add_argument(
+        '--repeat', dest='repeat', type=int, default=1,
+        help="Number of timed runs of each stage (the fastest is reported)")
+
+    arg_parser.add_argument(
+        '--no_memory', dest='memory', action='store_false',
+        help="Do not measure peak memory (saves one run of each stage)")
+
+    arg_parser.add_argument('--save_baseline', dest='save_baseline', help="Write the results to this JSON file")
+    arg_parser.add_argument('--baseline', dest='baseline', help="Compare the results against this JSON file")
+
+    arg_parser.add_argument(
+        '--tolerance', dest='tolerance', type=float, default=0.2,
+        help="Fraction a stage may be slower (or use more memory) than the baseline before it is a regression")
+
+    return arg_parser
+
+def measure(function, repeat, memory):
+    """
+    Runs a function and returns (result, fastest time in seconds, peak memory in MB or None)
+    Args:
+    function: The function to benchmark (with no arguments)
+    repeat: Number of timed runs
+    memory: If True, the function is run once more with tracemalloc to get its peak memory
+    """
+    result = None
+    fastest = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        fastest = elapsed if fastest is None else min(fastest, elapsed)
+
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        function()
+        (_, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_mb = peak / 1e6
+
+    return result, fastest, peak_mb
+
+def load_stages(spans):
+    """ Returns an OrderedDict of stage name to total seconds, from the spans recorded during one load """
+    stages = OrderedDict()
+    for span in spans:
+        if span["name"] != "DataManager.load":
+            stages["load/" + span["name"]] = stages.get("load/" + span["name"], 0.) + span["duration"]
+    return stages
+
+def run_benchmarks(folder, repeat, memory):
+    """
+    Runs each benchmark stage on a data folder and returns the results dictionary
+    Args:
+    folder: The data folder
+    repeat: Number of timed runs of each stage
+    memory: If True, the peak memory of each stage is measured
+    """
+    configmanager = ConfigManager(APPLICATION_DIR)
+    configmanager.load_dataset_config(folder)
+
+    stages = OrderedDict()
+
+    # Loading, with the spans of the first run broken out into sub-stages
+    timing.enable()
+    timing.clear()
+    spans = []
+
+    def load():
+        """ Load the folder, keeping the spans of the first run """
+        data_manager = DataManager(folder, configmanager).load()
+        if not spans:
+            spans.extend(timing.get_spans())
+        return data_manager
+
+    (data_manager, seconds, peak_mb) = measure(load, repeat, memory)
+    timing.enable(False)
+
+    stages["load"] = {"seconds":seconds, "peak_mb":peak_mb}
+    for name, stage_seconds in load_stages(spans).items():
+        stages[name] = {"seconds":stage_seconds, "peak_mb":None}
+
+    display_names = get_default_display_names(configmanager, data_manager)
+
+    # Averaging
+    (_, seconds, peak_mb) = measure(
+        lambda: data_manager.get_dataset_average(display_names[0], 3600), repeat, memory)
+    stages["get_dataset_average"] = {"seconds":seconds, "peak_mb":peak_mb}
+
+    # Windrose table
+    if data_manager.has_dataset("Wind Speed") and data_manager.has_dataset("Direction"):
+        speed = data_manager.get_dataset("Wind Speed")
+        direction = data_manager.get_dataset("Direction")
+        if len(speed) == len(direction):
+            bins = np.linspace(np.nanmin(speed), np.nanmax(speed), 6)
+            (_, seconds, peak_mb) = measure(
+                lambda: windrose.histogram(direction, speed, bins, 16, normed=True), repeat, memory)
+            stages["windrose.histogram"] = {"seconds":seconds, "peak_mb":peak_mb}
+
+    # Drawing the default plots
+    plotter = Plotter(configmanager)
+    for index, display_name in enumerate(display_names):
+        plotter.set_visibility(index, True)
+        plotter.set_dataset(
+            data_manager.get_timestamps(display_name), data_manager.get_dataset(display_name), display_name, index)
+
+    styles = [get_plotting_style(configmanager, data_manager, name) for name in display_names]
+    styles += [None] * (3 - len(styles))
+
+    def draw():
+        """ Draw and render the plots on a new figure """
+        fig = Figure(figsize=(8, 5), dpi=100)
+        canvas = FigureCanvasAgg(fig)
+        plotter.draw(fig, styles)
+        canvas.draw()
+
+    (_, seconds, peak_mb) = measure(draw, repeat, memory)
+    stages["Plotter.draw"] = {"seconds":seconds, "peak_mb":peak_mb}
+
+    (rows, total_bytes) = (0, 0)
+    for span in spans:
+        if span["name"] == "read_csv":
+            rows += span.get("rows", 0)
+            total_bytes += span.get("bytes", 0)
+
+    return {"dataset":{"folder":folder, "rows":rows, "bytes":total_bytes}, "stages":stages}
+
+def format_memory(peak_mb):
+    """ Returns a peak memory value as text ("-" if not measured) """
+    return "-" if peak_mb is None else "%.1f" % peak_mb
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the results alongside a baseline and returns the number of regressions
+    Args:
+    results: The results dictionary of this run
+    baseline: The results dictionary of the baseline run
+    tolerance: Fraction a stage may be slower (or use more memory) than the baseline
+    """
+    regressions = 0
+
+    print("%-36s %10s %10s %7s %12s %12s  %s" % (
+        "Stage", "Time (s)", "Base (s)", "Ratio", "Peak (MB)", "Base (MB)", ""))
+
+    for name, stage in results["stages"].items():
+        base = baseline["stages"].get(name)
+        if base is None:
+            print("%-36s %10.3f %10s %7s %12s %12s  new" % (
+                name, stage["seconds"], "-", "-", format_memory(stage["peak_mb"]), "-"))
+            continue
+
+        ratio = stage["seconds"] / base["seconds"] if base["seconds"] > 0 else 1.
+        flags = []
+        if ratio > 1 + tolerance:
+            flags.append("SLOWER")
+        if stage["peak_mb"] is not None and base["peak_mb"] and stage["peak_mb"] > base["peak_mb"] * (1 + tolerance):
+            flags.append("MORE MEMORY")
+
+        # Sub-stages of the load are shown for information, only whole stages count as regressions
+        if not name.startswith("load/"):
+            regressions += len(flags)
+
+        print("%-36s %10.3f %10.3f %7.2f %12s %12s  %s" % (
+            name, stage["seconds"], base["seconds"], ratio,
+            format_memory(stage["peak_mb"]), format_memory(base["peak_mb"]), " ".join(flags)))
+
+    return regressions
+
+def print_results(results):
+    """ Prints a table of results """
+    print("%-36s %10s %12s" % ("Stage", "Time (s)", "Peak (MB)"))
+    for name, stage in results["stages"].items():
+        print("%-36s %10.3f %12s" % (name, stage["seconds"], format_memory(stage["peak_mb"])))
+
+def main():
+    """ Run the benchmarks from the command line arguments """
+    args = get_arg_parser().parse_args()
+
+    folder = args.folder
+    if args.generate is not None:
+        folder = tempfile.mkdtemp(prefix="csvviewer_benchmark_")
+        generate_dataset.generate(
+            folder, generate_dataset.parse_size(args.generate), generate_dataset.parse_size("10MB"),
+            30, datetime.datetime(2015, 1, 1), "CSV01", 0)
+
+    try:
+        results = run_benchmarks(folder, args.repeat, args.memory)
+    finally:
+        if args.generate is not None:
+            shutil.rmtree(folder)
+
+    print("%d rows, %.1f MB" % (results["dataset"]["rows"], results["dataset"]["bytes"] / 1e6))
+
+    regressions = 0
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        print("%d regression(s) against %s" % (regressions, args.baseline))
+    else:
+        print_results(results)
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=1)
+
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+column_cache.py
+
+@author: James Fowkes
+
+A dictionary of field name to dataframe that keeps its contents within a memory budget.
+When the budget is exceeded, the least recently used dataframes are written to a spill file
+and dropped from memory. They are read back from the file when they are next used.
+
+The fields of a folder usually share one timestamp index object. It is counted once,
+is not written to the spill file with each field, and reloaded fields use it again.
+"""
+
+import pickle
+import tempfile
+import threading
+import logging
+
+from collections import OrderedDict, namedtuple
+from collections.abc import MutableMapping
+
+import pandas as pd
+
+def get_module_logger():
+
+    """ Returns logger for this module """
+    return logging.getLogger(__name__)
+
+def values_bytes(dataframe):
+    """ Returns the bytes used by a dataframe's values (not its index) """
+    return int(dataframe.memory_usage(index=False, deep=True).sum())
+
+def index_bytes(index):
+    """ Returns the bytes used by an index """
+    return int(index.memory_usage(deep=True))
+
+class CacheStats(namedtuple(
+        "CacheStats", ["hits", "misses", "evictions", "resident", "spilled", "resident_bytes", "spill_file_bytes"])):
+
+    """
+    Column cache statistics.
+    hits: Number of lookups of dataframes that were in memory
+    misses: Number of lookups that had to read the dataframe from the spill file
+    evictions: Number of times a dataframe was dropped from memory
+    resident: Number of dataframes in memory
+    spilled: Number of dataframes only in the spill file
+    resident_bytes: Bytes used by the dataframes in memory (each shared index counted once)
+    spill_file_bytes: Size of the spill file
+    """
+
+    __slots__ = ()
+
+class ColumnCache(MutableMapping):
+
+    """
+    Maps field names to dataframes, keeping at most budget bytes of dataframes in memory.
+
+    The least recently used dataframes are evicted first. The most recently used dataframe
+    always stays in memory, even if it is bigger than the budget on its own.
+
+    A dataframe is only written to the spill file the first time it is evicted
+    (or after it has been replaced), so evicting it again is free.
+    The spill file is a temporary file, deleted when the cache is closed or garbage collected.
+
+    Only a dataframe's column values are written with it. Its index is kept in memory while any
+    dataframe in memory uses it, and is written to the spill file once (and dropped) when none does.
+    A reloaded dataframe is rebuilt on its index object if that is in memory (otherwise the index is read back once),
+    so dataframes that shared an index still share it after being spilled.
+
+    Lookups can come from several threads, so all access is under a lock.
+    """
+
+    def __init__(self, budget=None, spill_dir=None):
+        """
+        Args:
+        budget: Bytes of dataframes to keep in memory (None to keep everything in memory)
+        spill_dir: Folder for the spill file (None for the system temporary folder)
+        """
+        self.budget = budget
+        self.spill_dir = spill_dir
+
+        self._resident = OrderedDict() # Least recently used first
+        self._sizes = OrderedDict() # Size of each dataframe's values, in the order they were added
+        self._spilled = {} # Offset of each dataframe's values in the spill file
+        self._spill_file = None
+
+        # Indexes are identified by a number, as an index that has been spilled is a new object when reloaded
+        self._index_of = {} # Key -> number of its dataframe's index
+        self._indexes = {} # Number -> index object, for indexes in memory
+        self._index_numbers = {} # id() of each index object in memory -> its number
+        self._index_sizes = {} # Number -> bytes used by the index
+        self._spilled_indexes = {} # Number -> offset of the index in the spill file
+        self._next_index = 0
+
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __getitem__(self, key):
+        with self._lock:
+            if key in self._resident:
+                self._hits += 1
+                self._resident.move_to_end(key)
+                return self._resident[key]
+
+            if key not in self._spilled:
+                raise KeyError(key)
+
+            self._misses += 1
+            (columns, values) = self._read(self._spilled[key])
+            dataframe = pd.DataFrame(OrderedDict(zip(columns, values)), columns=columns, index=self._load_index(key))
+            get_module_logger().info("Reloaded field '%s' from spill file", key)
+
+            self._resident[key] = dataframe
+            self._evict()
+            return dataframe
+
+    def __setitem__(self, key, dataframe):
+        with self._lock:
+            # Any spilled copy is now out of date
+            self._spilled.pop(key, None)
+            old_index = self._index_of.get(key)
+
+            self._resident[key] = dataframe
+            self._resident.move_to_end(key)
+            self._sizes[key] = values_bytes(dataframe)
+            self._index_of[key] = self._add_index(dataframe.index)
+
+            self._release_index(old_index)
+            self._evict()
+
+    def __delitem__(self, key):
+        with self._lock:
+            if key not in self._sizes:
+                raise KeyError(key)
+            del self._sizes[key]
+            self._resident.pop(key, None)
+            self._spilled.pop(key, None)
+            self._release_index(self._index_of.pop(key))
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._sizes))
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def __contains__(self, key):
+        return key in self._sizes
+
+    def resident_items(self):
+        """ Returns a list of (key, dataframe) of the dataframes in memory, without affecting their use order """
+        with self._lock:
+            return list(self._resident.items())
+
+    def size(self, key):
+        """ Returns the bytes used by a dataframe's values and index when it is in memory """
+        with self._lock:
+            return self._sizes[key] + self._index_sizes[self._index_of[key]]
+
+    def resident_bytes(self):
+        """ Returns the bytes used by the dataframes in memory, counting each index in memory once """
+        with self._lock:
+            return sum(self._sizes[key] for key in self._resident) + sum(
+                self._index_sizes[number] for number in self._indexes)
+
+    def stats(self):
+        """ Returns CacheStats for the cache """
+        with self._lock:
+            spill_file_bytes = 0
+            if self._spill_file is not None:
+                spill_file_bytes = self._spill_file.seek(0, 2)
+
+            return CacheStats(
+                self._hits, self._misses, self._evictions, len(self._resident), len(self._sizes) - len(self._resident),
+                self.resident_bytes(), spill_file_bytes)
+
+    def close(self):
+        """ Deletes the spill file. Spilled dataframes are lost. """
+        with self._lock:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+            for key in self._spilled:
+                if key not in self._resident:
+                    del self._sizes[key]
+                    self._release_index(self._index_of.pop(key))
+            self._spilled = {}
+            self._spilled_indexes = {}
+
+    def _evict(self):
+        """ Evicts least recently used dataframes until the cache is within its budget """
+        if self.budget is None:
+            return
+
+        while len(self._resident) > 1 and self.resident_bytes() > self.budget:
+            (key, dataframe) = self._resident.popitem(last=False)
+
+            if key not in self._spilled:
+                columns = list(dataframe.columns)
+                self._spilled[key] = self._write((columns, [dataframe[column].values for column in columns]))
+
+            self._evictions += 1
+            get_module_logger().info("Evicted field '%s' (%d bytes) to spill file", key, self._sizes[key])
+
+            self._drop_unused_index(self._index_of[key])
+
+    def _add_index(self, index):
+        """ Returns the number of an index, adding it to the indexes in memory if it is not already """
+        number = self._index_numbers.get(id(index))
+        if number is None:
+            number = self._next_index
+            self._next_index += 1
+            self._indexes[number] = index
+            self._index_numbers[id(index)] = number
+            self._index_sizes[number] = index_bytes(index)
+        return number
+
+    def _release_index(self, number):
+        """ Forgets an index (if it has one) once no key uses it """
+        if number is None or number in self._index_of.values():
+            return
+
+        index = self._indexes.pop(number, None)
+        if index is not None:
+            del self._index_numbers[id(index)]
+        del self._index_sizes[number]
+        self._spilled_indexes.pop(number, None)
+
+    def _drop_unused_index(self, number):
+        """ Drops an index from memory if no dataframe in memory uses it, writing it to the spill file first """
+        if any(self._index_of[key] == number for key in self._resident) or number not in self._indexes:
+            return
+
+        if number not in self._spilled_indexes:
+            self._spilled_indexes[number] = self._write(self._indexes[number])
+
+        index = self._indexes.pop(number)
+        del self._index_numbers[id(index)]
+
+    def _load_index(self, key):
+        """ Returns the index of a key's dataframe, reading it back from the spill file if it is not in memory """
+        number = self._index_of[key]
+        if number not in self._indexes:
+            index = self._read(self._spilled_indexes[number])
+            self._indexes[number] = index
+            self._index_numbers[id(index)] = number
+        return self._indexes[number]
+
+    def _write(self, item):
+        """ Appends an item to the spill file and returns its offset """
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(prefix="csvviewer_spill_", dir=self.spill_dir)
+
+        offset = self._spill_file.seek(0, 2)
+        pickle.dump(item, self._spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+        return offset
+
+    def _read(self, offset):
+        """ Returns the item at an offset in the spill file """
+        self._spill_file.seek(offset)
+        return pickle.load(self._spill_file)
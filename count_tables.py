@@ -0,0 +1,326 @@
+"""
+count_tables.py
+
+@author: James Fowkes
+
+Count tables (histograms) used for windrose and histogram plots.
+These only depend on numpy, so they can be built without importing matplotlib.
+"""
+
+import numpy as np
+
+def day_indices(timestamps):
+    """
+    Returns (days, indices) where days is the sorted array of distinct days (datetime64[D])
+    in timestamps and indices gives the position in days of each timestamp.
+    Sorted timestamps (as loaded data is) are split at the day boundaries without sorting them again.
+    Args:
+    timestamps: The timestamps (numpy datetime64 array or pandas index)
+    """
+    days = np.asarray(timestamps, dtype='datetime64[ns]').astype('datetime64[D]')
+    day_numbers = days.astype(np.int64) # NaT is the smallest int64
+
+    steps = np.diff(day_numbers)
+    if len(days) == 0 or (day_numbers == np.iinfo(np.int64).min).any() or (steps < 0).any():
+        return np.unique(days, return_inverse=True)
+
+    boundaries = np.flatnonzero(steps) + 1
+    indices = np.zeros(len(days), dtype=np.intp)
+    indices[boundaries] = 1
+    return days[np.concatenate(([0], boundaries))], np.cumsum(indices)
+
+def day_range_slice(days, start, end):
+    """
+    Returns the slice of a sorted days array that falls between start and end (inclusive)
+    Args:
+    days: Sorted array of datetime64[D]
+    start: First day (datetime.date), or None for the first day in the array
+    end: Last day (datetime.date), or None for the last day in the array
+    """
+    first = 0 if start is None else np.searchsorted(days, np.datetime64(start, 'D'), side='left')
+    last = len(days) if end is None else np.searchsorted(days, np.datetime64(end, 'D'), side='right')
+    return slice(first, max(first, last))
+
+def direction_edges(nsector):
+    """
+    Returns the list of sector start angles (in degrees) for a windrose of nsector sectors.
+    The first sector is centred on north, so it starts at 360 - (half a sector).
+    Args:
+    nsector: The number of sectors
+    """
+    angle = 360./nsector
+    edges = (np.arange(nsector) - 0.5) * angle
+    edges[0] = 360. - angle/2
+    return edges.tolist()
+
+class WindHistogram:
+
+    """
+    Builds windrose tables (counts of var values in each direction sector) for one wind record.
+
+    The sector and var bin of each sample are computed once and cached, so
+    changing nsector, bins or normed only recomputes what depends on it.
+    The table itself is a single np.bincount over the combined (bin, sector) index.
+    """
+
+    def __init__(self, direction, var):
+        """
+        Args:
+        direction : 1D array - directions the wind blows from, North centred
+        var : 1D array - values of the variable to compute. Typically the wind speeds
+        """
+        if len(var) != len(direction):
+            raise ValueError("var (%d) and direction (%d) must have same length" % (len(var), len(direction)))
+
+        self.direction = np.asarray(direction, dtype=float)
+        self.var = np.asarray(var, dtype=float)
+
+        self._var_range = None
+        self._sector_cache = {}
+        self._bin_cache = {}
+        self._count_cache = {}
+
+    def var_range(self):
+        """ Returns the (min, max) of the var data, ignoring NaNs """
+        if self._var_range is None:
+            self._var_range = (np.nanmin(self.var), np.nanmax(self.var))
+        return self._var_range
+
+    def nbytes(self):
+        """ Returns the bytes used by the cached sector, bin and count arrays """
+        caches = (self._sector_cache, self._bin_cache, self._count_cache)
+        return sum(array.nbytes for cache in caches for array in cache.values())
+
+    def sector_indices(self, nsector, blowto=False):
+        """
+        Returns the sector (0 to nsector-1) of each sample, or -1 if it has no valid direction.
+        Sector 0 is centred on north.
+        Args:
+        nsector: The number of sectors
+        blowto: If True, directions are rotated by 180 degrees
+        """
+        key = (nsector, blowto)
+        if key not in self._sector_cache:
+            direction = self.direction + 180. if blowto else self.direction
+
+            # Adding half a sector centres sector 0 on north; the modulo folds
+            # the end of the last sector back into the north sector.
+            sectors = np.floor(direction * (nsector / 360.) + 0.5)
+            valid = np.isfinite(sectors)
+            sectors[~valid] = 0
+            sectors = sectors.astype(np.intp) % nsector
+            sectors[~valid] = -1
+
+            self._sector_cache[key] = sectors.astype(np.int16)
+
+        return self._sector_cache[key]
+
+    def bin_indices(self, bins):
+        """
+        Returns the var bin of each sample, or -1 if it is NaN or below the first bin.
+        Bin i holds bins[i] <= var < bins[i+1]. The last bin has no upper limit.
+        Args:
+        bins: 1D array of bin start values
+        """
+        key = tuple(bins)
+        if key not in self._bin_cache:
+            indices = np.searchsorted(bins, self.var, side='right') - 1
+            indices[np.isnan(self.var)] = -1
+            self._bin_cache[key] = indices.astype(np.int16)
+
+        return self._bin_cache[key]
+
+    def counts(self, bins, nsector, blowto=False):
+        """
+        Returns the (nbins, nsector) table of sample counts
+        Args:
+        bins: 1D array of bin start values
+        nsector: The number of sectors
+        blowto: If True, directions are rotated by 180 degrees
+        """
+        key = (tuple(bins), nsector, blowto)
+        if key not in self._count_cache:
+            nbins = len(bins)
+            counts = np.bincount(self.cell_indices(bins, nsector, blowto), minlength=nbins*nsector + 1)[:-1]
+            self._count_cache[key] = counts.reshape(nbins, nsector).astype(float)
+
+        return self._count_cache[key].copy()
+
+    def cell_indices(self, bins, nsector, blowto=False):
+        """
+        Returns the flattened (bin * nsector + sector) table cell of each sample.
+        Samples outside the table are given the extra cell nbins * nsector.
+        Args:
+        bins: 1D array of bin start values
+        nsector: The number of sectors
+        blowto: If True, directions are rotated by 180 degrees
+        """
+        sectors = self.sector_indices(nsector, blowto)
+        var_bins = self.bin_indices(bins)
+
+        cells = var_bins.astype(np.intp) * nsector + sectors
+        cells[(var_bins < 0) | (sectors < 0)] = len(bins) * nsector
+
+        return cells
+
+    def table(self, bins, nsector, normed=False, blowto=False):
+        """
+        Returns (dir_edges, var_bins, table) in the same form as windrose.histogram
+        Args:
+        bins: 1D array of bin start values
+        nsector: The number of sectors
+        normed: If True, the table is normed in percent
+        blowto: If True, directions are rotated by 180 degrees
+        """
+        bins = np.asarray(bins, dtype=float)
+        table = self.counts(bins, nsector, blowto)
+        if normed:
+            table = table*100/table.sum()
+
+        var_bins = bins.tolist()
+        var_bins.append(np.inf)
+
+        return direction_edges(nsector), var_bins, table
+
+class FixedWindTable:
+
+    """
+    A precomputed windrose count table.
+    It has the same table()/var_range() interface as WindHistogram, so it can be
+    passed to WindroseAxes plots as their wind_histogram, but only for the bins
+    and number of sectors it was computed with.
+    """
+
+    def __init__(self, bins, nsector, counts):
+        """
+        Args:
+        bins: 1D array of bin start values
+        nsector: The number of sectors
+        counts: The (nbins, nsector) table of sample counts
+        """
+        self.bins = np.asarray(bins, dtype=float)
+        self.nsector = nsector
+        self.counts = counts
+
+    def var_range(self):
+        """ Returns the range of the first and last bin start values """
+        return (self.bins[0], self.bins[-1])
+
+    def table(self, bins, nsector, normed=False, blowto=False):
+        """
+        Returns (dir_edges, var_bins, table) in the same form as windrose.histogram
+        Raises ValueError if bins, nsector or blowto differ from the precomputed table.
+        """
+        bins = np.asarray(bins, dtype=float)
+        if blowto or nsector != self.nsector or bins.shape != self.bins.shape or not np.allclose(bins, self.bins):
+            raise ValueError("Windrose table was precomputed for %d sectors and bins %s" % (self.nsector, self.bins))
+
+        table = self.counts.astype(float)
+        if normed:
+            table = table*100/table.sum()
+
+        var_bins = self.bins.tolist()
+        var_bins.append(np.inf)
+
+        return direction_edges(nsector), var_bins, table
+
+class DailyWindTable:
+
+    """
+    Windrose counts for each day of a wind record, stored as cumulative sums over the days.
+    The table for any range of days is then the difference of two cumulative tables,
+    however long the record is.
+    """
+
+    def __init__(self, wind_histogram, timestamps, bins, nsector, days=None): #pylint: disable=too-many-arguments
+        """
+        Args:
+        wind_histogram: WindHistogram of the wind record
+        timestamps: Timestamps of the samples in the wind record
+        bins: 1D array of bin start values
+        nsector: The number of sectors
+        days: The result of day_indices(timestamps), if it has already been computed
+        """
+        self.bins = np.asarray(bins, dtype=float)
+        self.nsector = nsector
+        self.days, day_index = day_indices(timestamps) if days is None else days
+
+        ndays = len(self.days)
+        nbins = len(self.bins)
+        ncells = nbins * nsector + 1 # One extra cell per day for samples outside the table
+
+        cells = wind_histogram.cell_indices(self.bins, nsector) + day_index * ncells
+        counts = np.bincount(cells, minlength=ndays * ncells).reshape(ndays, ncells)[:, :-1]
+
+        # cumulative[n] is the total of the first n days
+        self.cumulative = np.zeros((ndays + 1, nbins, nsector), dtype=np.int64)
+        self.cumulative[1:] = np.cumsum(counts, axis=0).reshape(ndays, nbins, nsector)
+
+    def between(self, start=None, end=None):
+        """
+        Returns a FixedWindTable of the days between start and end (inclusive)
+        Args:
+        start: First day (datetime.date), or None to start at the beginning of the record
+        end: Last day (datetime.date), or None to finish at the end of the record
+        """
+        days = day_range_slice(self.days, start, end)
+        counts = self.cumulative[days.stop] - self.cumulative[days.start]
+        return FixedWindTable(self.bins, self.nsector, counts)
+
+    def nbytes(self):
+        """ Returns the bytes used by the cumulative table and days arrays """
+        return self.cumulative.nbytes + self.days.nbytes
+
+class DailyHistogram:
+
+    """
+    A fixed-edge histogram of a dataset, kept as counts per day stored as cumulative sums.
+    The histogram of any range of days is the difference of two cumulative rows,
+    so it never needs the raw data once built.
+    """
+
+    def __init__(self, data, timestamps, bin_count, days=None):
+        """
+        Args:
+        data: The data values
+        timestamps: The timestamps of the data values
+        bin_count: The number of equal-width bins between the min and max of the data
+        days: The result of day_indices(timestamps), if it has already been computed
+        """
+        data = np.asarray(data, dtype=float)
+        finite = np.isfinite(data)
+
+        (low, high) = (np.min(data[finite]), np.max(data[finite])) if finite.any() else (0., 1.)
+        if low == high:
+            (low, high) = (low - 0.5, high + 0.5) # Same as np.histogram for constant data
+
+        self.edges = np.linspace(low, high, bin_count + 1)
+        self.days, day_index = day_indices(timestamps) if days is None else days
+
+        ndays = len(self.days)
+        ncells = bin_count + 1 # One extra cell per day for non-finite values
+
+        # Equal width bins, so the bin is found arithmetically. The maximum value goes in the last bin.
+        bins = np.clip(np.floor((data - low) * (bin_count / (high - low))), 0, bin_count - 1)
+        bins[~finite] = bin_count
+
+        cells = bins.astype(np.intp) + day_index * ncells
+        counts = np.bincount(cells, minlength=ndays * ncells).reshape(ndays, ncells)[:, :-1]
+
+        # cumulative[n] is the total of the first n days
+        self.cumulative = np.zeros((ndays + 1, bin_count), dtype=np.int64)
+        self.cumulative[1:] = np.cumsum(counts, axis=0)
+
+    def counts(self, start=None, end=None):
+        """
+        Returns the count in each bin for the days between start and end (inclusive)
+        Args:
+        start: First day (datetime.date), or None to start at the beginning of the data
+        end: Last day (datetime.date), or None to finish at the end of the data
+        """
+        days = day_range_slice(self.days, start, end)
+        return self.cumulative[days.stop] - self.cumulative[days.start]
+
+    def nbytes(self):
+        """ Returns the bytes used by the cumulative counts, days and edges arrays """
+        return self.cumulative.nbytes + self.days.nbytes + self.edges.nbytes
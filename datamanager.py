@@ -7,29 +7,368 @@ Datamanager class for data from CSV files
 """
 
 import pandas as pd
+import numpy as np
+import io
 import os
 import logging
+import sqlite3
+import itertools
+import concurrent.futures
 
 import threading
+import time
 
-from datetime import timedelta
+from collections import namedtuple, deque
+from datetime import date, datetime, timedelta
 
 from special_fields import get_special_field
+import timing
+from count_tables import WindHistogram, DailyWindTable, DailyHistogram, day_indices
+from column_cache import ColumnCache
+from manifest import is_data_file
+from archives import is_compressed, is_zip, member_names, open_member
+import parsers
+from parsers import DEFAULT_PARSER
+from prefetch import FilePrefetcher
 
 # Data loading events
 EVT_DATA_LOAD_COMPLETE = -1
 EVT_DATA_PROCESSING_COMPLETE = -2
+EVT_DATA_LOAD_CANCELLED = -3
+EVT_DATA_NOT_IN_RANGE = -4
+
+# Files are read in chunks of this many rows, so that a cancel request is seen quickly
+READ_CHUNK_ROWS = 100000
+
+# Files split into byte ranges for parallel parsing are split into ranges of about this many bytes
+RANGE_BYTES = 32 * 1000 * 1000
+
+# Bytes read from the end of a file to find its last timestamp
+PROBE_BYTES = 4096
+
+# Data loading stages (reported in progress events)
+STAGE_READING = "Reading files"
+STAGE_PROCESSING = "Processing data"
+
+class LoadCancelled(Exception):
+    """ Raised inside the data manager to abandon loading when it is cancelled """
+    pass
+
+class NoDataInRange(LoadCancelled):
+    """ Raised when loading with a date range and no data in the folder is in the range """
+    pass
+
+class ProgressEvent(namedtuple("ProgressEvent", ["stage", "percent", "bytes_read", "total_bytes", "rows", "elapsed"])):
+
+    """
+    Progress update sent by the data manager while loading.
+    Progress through the reading stage is weighted by file size.
+    stage: One of the STAGE_ strings
+    percent: Percent complete of the current stage
+    bytes_read: Bytes of CSV files read so far
+    total_bytes: Total bytes of all CSV files being loaded
+    rows: Rows parsed so far
+    elapsed: Seconds since loading started
+    """
+
+    __slots__ = ()
+
+    @property
+    def bytes_per_second(self):
+        """ Average read throughput so far """
+        return self.bytes_read / self.elapsed if self.elapsed > 0 else 0.
+
+    @property
+    def rows_per_second(self):
+        """ Average parsing throughput so far """
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.
+
+    @property
+    def eta_seconds(self):
+        """ Estimated seconds until all files are read (None if not known) """
+        if self.stage != STAGE_READING or self.bytes_per_second == 0:
+            return None
+        return (self.total_bytes - self.bytes_read) / self.bytes_per_second
+
+class LoadOptions(namedtuple(
+        "LoadOptions", ["split_bytes", "parse_processes", "prefetch_files", "prefetch_bytes", "parser"])):
+
+    """
+    Settings for how files are read.
+    split_bytes: Files of at least this many bytes are split into byte ranges (of RANGE_BYTES)
+        which are parsed in parallel worker processes. None to never split files.
+    parse_processes: Number of worker processes parsing the ranges and the members of zip archives
+        (None for one per CPU, 1 to parse them in the loading thread)
+    prefetch_files: Number of files read into memory ahead of the file being parsed (0 for no prefetching)
+    prefetch_bytes: The most bytes of files to read ahead (bigger files, and files that are split, are not prefetched)
+    parser: Name of the CSV parser backend (one of parsers.PARSER_NAMES)
+    """
+
+    __slots__ = ()
+
+DEFAULT_LOAD_OPTIONS = LoadOptions(
+    split_bytes=256 * 1000 * 1000, parse_processes=None, prefetch_files=2, prefetch_bytes=64 * 1000 * 1000,
+    parser=DEFAULT_PARSER)
+
+class FieldMemory(namedtuple(
+        "FieldMemory", ["field", "rows", "values", "index", "objects", "index_shared_with", "index_duplicate_of"])):
+
+    """
+    Memory used by one field's dataframe, in bytes.
+    field: The field name
+    rows: Number of rows
+    values: Bytes of the values array
+    index: Bytes of the timestamp index (0 if the index object is shared with another field)
+    objects: Bytes of Python objects referenced by the values (e.g. strings in a text field)
+    index_shared_with: Field whose index object this field also uses (None if not shared)
+    index_duplicate_of: Field with an equal index that is stored separately (None if there is none)
+    """
+
+    __slots__ = ()
+
+    @property
+    def total(self):
+        """ Total bytes used by this field """
+        return self.values + self.index + self.objects
+
+class MemoryReport(namedtuple("MemoryReport", ["fields", "tables", "column_cache"])):
+
+    """
+    Memory used by loaded data.
+    fields: List of FieldMemory (of the fields in memory)
+    tables: List of (name, bytes) of precomputed tables and caches
+    column_cache: column_cache.CacheStats of the fields (None if no data is loaded)
+    """
+
+    __slots__ = ()
+
+    @property
+    def total(self):
+        """ Total bytes used by fields and tables """
+        return sum(field.total for field in self.fields) + sum(table_bytes for (_, table_bytes) in self.tables)
+
+def summarise_memory(report, budget=None):
+    """
+    Returns lines of text describing a MemoryReport
+    Args:
+    report: The MemoryReport
+    budget: Memory budget in bytes (or None for no budget)
+    """
+    lines = ["%-20s %10s %12s %12s %12s %12s  %s" % (
+        "Field", "Rows", "Values (MB)", "Index (MB)", "Objects (MB)", "Total (MB)", "Notes")]
+
+    for field in report.fields:
+        if field.index_shared_with is not None:
+            notes = "index shared with %s" % field.index_shared_with
+        elif field.index_duplicate_of is not None:
+            notes = "index duplicates %s" % field.index_duplicate_of
+        else:
+            notes = ""
+
+        lines.append("%-20s %10d %12.2f %12.2f %12.2f %12.2f  %s" % (
+            field.field, field.rows, field.values / 1e6, field.index / 1e6, field.objects / 1e6, field.total / 1e6,
+            notes))
+
+    for (name, table_bytes) in report.tables:
+        lines.append("%-70s %12.2f" % (name, table_bytes / 1e6))
+
+    lines.append("%-70s %12.2f" % ("Total", report.total / 1e6))
+
+    if report.column_cache is not None:
+        cache = report.column_cache
+        lines.append(
+            "Column cache: %d fields in memory, %d spilled to disk (%.1f MB spill file). "
+            "%d hits, %d misses, %d evictions" % (
+                cache.resident, cache.spilled, cache.spill_file_bytes / 1e6, cache.hits, cache.misses, cache.evictions))
+
+    if budget is not None:
+        if report.total > budget:
+            lines.append("Over the memory budget of %.0f MB" % (budget / 1e6))
+        else:
+            lines.append("Within the memory budget of %.0f MB" % (budget / 1e6))
+
+    return lines
+
+# Daily windrose tables are precomputed with the default WindroseAxes bins and sectors
+WINDROSE_BIN_COUNT = 6
+WINDROSE_SECTOR_COUNT = 16
+
+# Number of bins in the precomputed per-field histograms
+HISTOGRAM_BIN_COUNT = 50
+
+def cached_day_indices(index, cache):
+    """
+    Returns count_tables.day_indices of an index, computing it only once for each index object
+    Args:
+    index: The timestamp index
+    cache: dict of id of each index -> (index, its day_indices). The index is kept so its id is not reused.
+    """
+    if id(index) not in cache:
+        cache[id(index)] = (index, day_indices(index))
+    return cache[id(index)][1]
 
 def valid_filename(filename):
-    """ Returns true if the filename ends with .csv.
+    """ Returns true if the filename ends with .csv (or .csv.gz, .csv.bz2 or .zip).
     Used for filtering a directory listing for valid files """
-    return filename.lower().endswith(".csv")
+    return is_data_file(filename)
 
 def get_module_logger():
 
     """ Returns logger for this module """
     return logging.getLogger(__name__)
 
+def get_config_section(config, section):
+    """ Returns a section of dataset configuration as a dict (empty if the section does not exist)
+    Args:
+    config: A ConfigManager (its dataset config is used), a dict of section name to dict of options
+        (in the same format as config.txt, e.g. {"LIMITS":{"Temperature":"-20, 50"}}), or None
+    section: The section to get
+    """
+    if config is None:
+        return {}
+    elif isinstance(config, dict):
+        return dict(config.get(section, {}))
+    else:
+        return config.get_dataset_config(section)
+
+def time_range_slice(timestamps, start=None, end=None):
+    """
+    Returns the slice of sorted timestamps between start and end (inclusive), found by binary search.
+    Slicing a series with it gives a view of the data, so no data is copied.
+    Args:
+    timestamps: Sorted timestamps (pandas DatetimeIndex or numpy datetime64 array)
+    start: First time (datetime, date or numpy datetime64), or None to start at the first timestamp
+    end: Last time, or None to finish at the last timestamp. A date (with no time) includes the whole day.
+    """
+    values = np.asarray(timestamps)
+
+    first = 0 if start is None else np.searchsorted(values, np.datetime64(start, 'ns'), side='left')
+
+    if end is None:
+        last = len(values)
+    elif isinstance(end, date) and not isinstance(end, datetime):
+        last = np.searchsorted(values, np.datetime64(end + timedelta(days=1), 'ns'), side='left')
+    else:
+        last = np.searchsorted(values, np.datetime64(end, 'ns'), side='right')
+
+    return slice(int(first), int(max(first, last)))
+
+def range_limits(start=None, end=None):
+    """
+    Returns (first, after) pandas Timestamps for a date range: data in the range is at or after first and before after.
+    Either is None if that end of the range is open.
+    Args:
+    start: First time (datetime or date), or None
+    end: Last time, or None. A date (with no time) includes the whole day.
+    """
+    first = None if start is None else pd.Timestamp(start)
+
+    if end is None:
+        after = None
+    elif isinstance(end, date) and not isinstance(end, datetime):
+        after = pd.Timestamp(end + timedelta(days=1))
+    else:
+        after = pd.Timestamp(end) + pd.Timedelta(1, 'ns')
+
+    return (first, after)
+
+def trim_to_range(dataframe, first, after):
+    """
+    Returns the rows of a dataframe with a timestamp index that are within range limits
+    Args:
+    dataframe: The dataframe to trim
+    first, after: Range limits from range_limits
+    """
+    if not isinstance(dataframe.index, pd.DatetimeIndex):
+        return dataframe
+
+    keep = np.ones(len(dataframe), dtype=bool)
+    if first is not None:
+        keep &= dataframe.index >= first
+    if after is not None:
+        keep &= dataframe.index < after
+
+    return dataframe if keep.all() else dataframe[keep]
+
+def parse_line_time(line):
+    """ Returns the datetime from the date and time (second and third) columns of one line of CSV bytes """
+    fields = line.decode("utf8", "replace").split(",")
+    timestamp = pd.to_datetime("%s %s" % (fields[1].strip(), fields[2].strip()), dayfirst=True)
+    if pd.isnull(timestamp):
+        raise ValueError("No time in '%s'" % line)
+    return timestamp.to_pydatetime()
+
+def probe_time_bounds(path):
+    """
+    Returns (first, last) datetimes of a CSV file from its first and last data lines,
+    without reading the rest of the file. Returns (None, None) if they cannot be read.
+    Compressed files are not probed (finding their last line means decompressing the whole file),
+    so they are read unless the manifest has recorded their times.
+    Args:
+    path: The CSV file
+    """
+    if is_compressed(path):
+        return (None, None)
+    with open(path, "rb") as data_file:
+        data_file.readline() # Header
+        first_line = data_file.readline()
+        size = data_file.seek(0, 2)
+        data_file.seek(max(0, size - PROBE_BYTES))
+        lines = [line for line in data_file.read().splitlines() if line.strip()]
+
+    try:
+        return (parse_line_time(first_line), parse_line_time(lines[-1]))
+    except (ValueError, IndexError):
+        return (None, None)
+
+def split_byte_ranges(path, range_bytes):
+    """
+    Splits the data lines of a CSV file into byte ranges of about range_bytes, each starting at the start of a line.
+    Returns (header line as bytes, list of (start, end) byte offsets in file order)
+    Args:
+    path: The CSV file
+    range_bytes: Approximate size of each range
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as data_file:
+        header = data_file.readline()
+        starts = [data_file.tell()]
+
+        while size - starts[-1] > range_bytes:
+            # Move on to the start of the line after the target offset
+            data_file.seek(starts[-1] + range_bytes - 1)
+            data_file.readline()
+            if data_file.tell() >= size:
+                break
+            starts.append(data_file.tell())
+
+    return (header, list(zip(starts, starts[1:] + [size])))
+
+def read_csv_range(path, header, start, end, parser=DEFAULT_PARSER): #pylint: disable=too-many-arguments
+    """
+    Parses one byte range of a CSV file (as _read_files parses whole files). Runs in a worker process.
+    Args:
+    path: The CSV file
+    header: The file's header line (as bytes), which is parsed before the range so every range has the same columns
+    start, end: Byte offsets of the range (from split_byte_ranges)
+    parser: Name of the parser backend (see parsers.py)
+    """
+    with open(path, "rb") as data_file:
+        data_file.seek(start)
+        data = data_file.read(end - start)
+
+    return parsers.parse(lambda: io.BytesIO(header + data), parser)
+
+def read_archive_member(path, member, parser=DEFAULT_PARSER):
+    """
+    Parses one CSV file in a zip archive (as _read_files parses whole files). Runs in a worker process.
+    Args:
+    path: The zip archive
+    member: The name of the CSV file in the archive
+    parser: Name of the parser backend (see parsers.py)
+    """
+    return parsers.parse(lambda: open_member(path, member), parser)
+
 def get_csv_filenames(folder):
 
     """ Get a list of valid CSV files
@@ -44,7 +383,7 @@ def get_csv_filenames(folder):
 
     return filenames
 
-class DataManager(threading.Thread):
+class DataManager:
 
     """
     The data manager is responsible for reading CSV files, performing data
@@ -52,29 +391,67 @@ class DataManager(threading.Thread):
 
     The data manager is dependent on the pandas library for dataset processing.
 
-    The data manager runs in a separate thread to the rest of the application.
-    This is so the application can get IO status updates during long operations
-    such as CSV file read and parsing.
+    Loading is synchronous, so the data manager can be used from scripts without any GUI:
+
+        data_manager = DataManager(folder, {"LIMITS":{"Temperature":"-20, 50"}}).load()
 
-    too-many-instance-attributes is disabled, as there's "only" 8.
+    The application loads it in a separate thread with DataManagerThread,
+    so that it can get IO status updates during long operations such as CSV file read and parsing.
+
+    Loading can be cancelled (from another thread) with cancel().
+
+    too-many-instance-attributes is disabled.
     This class could maybe be split up into smaller parts to make it simpler.
 
     """
     #pylint: disable=too-many-instance-attributes
-    def __init__(self, msg_queue, folder, configmanager):
-        threading.Thread.__init__(self)
-        self.queue = msg_queue
+    def __init__( #pylint: disable=too-many-arguments
+            self, folder, config=None, cache_budget=None, spill_dir=None, manifest=None, date_range=None,
+            load_options=None):
+        """
+        Args:
+        folder: The folder of CSV files to load
+        config: Dataset configuration (special fields and limits): a ConfigManager,
+            a dict of section name to dict of options, or None for no configuration
+        cache_budget: Bytes of field data to keep in memory once loaded (None to keep every field in memory).
+            Least recently used fields are spilled to disk and read back when needed.
+        spill_dir: Folder for the spill file (None for the system temporary folder)
+        manifest: Optional manifest.FolderManifest of the folder. It is scanned before loading
+            (the changes since the last load are kept in folder_changes) and updated as each file is parsed.
+        date_range: Optional (start, end) dates or datetimes (either can be None) to load.
+            Files entirely outside the range are not read, and rows outside the range are dropped.
+        load_options: LoadOptions for reading files (None for DEFAULT_LOAD_OPTIONS)
+        """
         self.folder = folder
+        self.cache_budget = cache_budget
+        self.spill_dir = spill_dir
+        self.manifest = manifest
+        self.folder_changes = None
+        self.date_range = date_range
+        self.skipped_files = 0
+        self.load_options = DEFAULT_LOAD_OPTIONS if load_options is None else load_options
+        self._parse_pool = None
 
         self._numeric_fields = None
         self._display_to_field_dict = None
         self._field_to_display_dict = None
         self.dataframes = None
+        self.daily_wind_table = None
+        self.histograms = {}
+
+        # Loading progress and cancellation
+        self._progress = None
+        self._cancel_event = threading.Event()
+        self.keep_partial = False
+        self._start_time = None
+        self._total_bytes = 0
+        self._bytes_read = 0
+        self._rows = 0
 
         # These fields have special processing applied before they are displayed
         self.special_fields = {}
         try:
-            for field_name, field_options in configmanager.get_dataset_config('SPECIAL FIELDS').items():
+            for field_name, field_options in get_config_section(config, 'SPECIAL FIELDS').items():
                 # Each field_options is a comma-separated list of options
                 field_options = [option.strip() for option in field_options.split(",")]
                 field_type = field_options[0] # The first option is the type of field
@@ -87,7 +464,7 @@ class DataManager(threading.Thread):
         # Some fields might want to be limited by the user
         self.limits = {}
         try:
-            for display_name, limits in configmanager.get_dataset_config('LIMITS').items():
+            for display_name, limits in get_config_section(config, 'LIMITS').items():
                 #limits should be two numbers separated by a comma
                 try:
                     limits = limits.split(",")
@@ -98,55 +475,380 @@ class DataManager(threading.Thread):
         except KeyError:
             pass # No limits specified in config file
 
-    def run(self):
+    def cancel(self, keep_partial=False):
+        """
+        Asks the data manager to stop loading.
+        Loading stops at the next file or chunk boundary.
+        Args:
+        keep_partial: If True, data already read is processed as normal.
+            Otherwise, load() raises LoadCancelled and no data is kept.
+        """
+        self.keep_partial = keep_partial
+        self._cancel_event.set()
+
+    def _check_cancelled(self):
+        """ Raises LoadCancelled if loading has been cancelled without keeping partial data """
+        if self._cancel_event.is_set() and not self.keep_partial:
+            raise LoadCancelled()
+
+    def _progress_event(self, stage, percent):
+        """ Returns a progress event for the current state of loading """
+        return ProgressEvent(
+            stage, percent, self._bytes_read, self._total_bytes, self._rows, time.time() - self._start_time)
+
+    def _report_progress(self, stage, percent):
+        """ Passes a progress event to the progress function (if there is one) """
+        if self._progress is not None:
+            self._progress(self._progress_event(stage, percent))
+
+    def load(self, progress=None):
+        """
+        Loads and processes all CSV files in the folder.
+        Returns the data manager itself, so that it can be created and loaded in one line.
+        Raises LoadCancelled if loading was cancelled (and partial data was not kept).
+        Args:
+        progress: Optional function that is called with a ProgressEvent as loading progresses
+        """
+        self._progress = progress
+        try:
+            with timing.span("DataManager.load", folder=self.folder) as load_span:
+                self._start_time = time.time()
+                frames = self._read_files()
+                load_span.set(rows=self._rows, bytes=self._bytes_read, files=len(frames))
+
+                if not frames:
+                    if self.date_range is not None and not self._cancel_event.is_set():
+                        raise NoDataInRange()
+                    raise LoadCancelled() # Cancelled before anything was read
+
+                self._process(frames)
+
+        except LoadCancelled:
+            get_module_logger().info("Loading from %s cancelled", self.folder)
+            self.dataframes = None
+            raise
+
+        finally:
+            if self._parse_pool is not None:
+                self._parse_pool.shutdown()
+                self._parse_pool = None
+
+        self._report_progress(STAGE_PROCESSING, 100)
+        return self
+
+    def _read_files(self):
         """
-        Parse the file with pandas
+        Parse the files with pandas
         Use columns 1 and 2 to get datetime from
         This creates a new column 0, which is the combined datetime used as index
+
+        Files are read in chunks, so a cancel request is seen between chunks as well as between files.
+        With a date range, files outside the range are skipped and each chunk is trimmed to the range.
+        Returns the list of dataframes read (which may be partial if cancelled)
         """
 
-        filenames = get_csv_filenames(self.folder)
+        # Progress is weighted by file size, so get all the sizes up front
+        (filenames, file_sizes) = self._select_files(*self._get_files())
+        full_paths = [os.path.join(self.folder, filename) for filename in filenames]
+        self._total_bytes = sum(file_sizes)
+
+        limits = range_limits(*self.date_range) if self.date_range is not None else (None, None)
+
+        prefetcher = self._start_prefetch(full_paths, file_sizes)
+        prefetched = set(prefetcher.paths) if prefetcher is not None else set()
 
         frames = []
-        total_file_count = len(filenames)
-        percent_complete = 0
+        try:
+            for filename, full_path, file_bytes in zip(filenames, full_paths, file_sizes):
+
+                # Do not start on the next file once cancelled
+                if self._cancel_event.is_set():
+                    break
+
+                # Create a dataframe for each CSV file and append to the frames list
+
+                data = None
+                if prefetcher is not None and full_path in prefetched:
+                    with timing.span("prefetch.wait", file=filename):
+                        data = prefetcher.get(full_path)
+
+                dataframe = self._read_file(filename, full_path, file_bytes, data, limits)
+                if dataframe is not None:
+                    frames.append(dataframe)
+
+                # A file cut short by a cancel is counted in full, as its rows are kept
+                self._bytes_read += file_bytes
+                if self._cancel_event.is_set():
+                    break
+
+                percent_complete = (self._bytes_read * 100) / self._total_bytes if self._total_bytes > 0 else 100
+                self._report_progress(STAGE_READING, percent_complete)
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+
+        self._check_cancelled()
+        return frames
+
+    def _read_file(self, filename, full_path, file_bytes, data, limits): #pylint: disable=too-many-arguments
+        """
+        Reads one CSV file in chunks and returns its dataframe, trimmed to the date range
+        (None if nothing was read, or no rows are in the date range)
+        Args:
+        filename: The file name
+        full_path: The path of the file
+        file_bytes: The size of the file
+        data: The file's bytes if they have been prefetched (or None)
+        limits: (first, after) limits of the date range from range_limits
+        """
+        (first, after) = limits
+        with timing.span("read_csv", file=filename, bytes=file_bytes) as read_span:
+            chunks = []
+            file_rows = 0
+            (file_first, file_last) = (None, None)
+            reader = self._read_chunks(full_path, file_bytes, data)
+            for chunk in reader:
+                if len(chunk):
+                    file_rows += len(chunk)
+                    file_first = chunk.index[0] if file_first is None else file_first
+                    file_last = chunk.index[-1]
+
+                chunks.append(trim_to_range(chunk, first, after))
+                if self._cancel_event.is_set():
+                    break
+
+                # Rows are in time order, so nothing after this chunk is in the range
+                if after is not None and len(chunk) and isinstance(chunk.index, pd.DatetimeIndex):
+                    if file_last >= after:
+                        break
+            else:
+                # The whole file was read, so the manifest can record its details
+                self._record_file(filename, file_rows, file_first, file_last)
+
+            reader.close()
+
+            if not chunks:
+                return None
+
+            dataframe = pd.concat(chunks)
+            read_span.set(rows=len(dataframe))
+            self._rows += len(dataframe)
+
+        return dataframe if len(dataframe) or self.date_range is None else None
+
+    def _start_prefetch(self, full_paths, file_sizes):
+        """
+        Returns a FilePrefetcher reading files ahead of them being parsed
+        (or None if prefetching is turned off, or there is nothing to prefetch).
+        Files that are split into byte ranges, and zip archives, are read by the parsing processes, so are not prefetched.
+        Args:
+        full_paths: The files that will be read, in order
+        file_sizes: Their sizes
+        """
+        options = self.load_options
+        if not options.prefetch_files:
+            return None
+
+        paths = [
+            path for (path, file_bytes) in zip(full_paths, file_sizes)
+            if not is_zip(path) and not self._is_split(path, file_bytes)]
+
+        return FilePrefetcher(paths, options.prefetch_files, options.prefetch_bytes) if len(paths) > 1 else None
+
+    def _is_split(self, path, file_bytes):
+        """ Returns True if a file is big enough to be split into byte ranges (compressed files never are) """
+        split_bytes = self.load_options.split_bytes
+        return split_bytes is not None and file_bytes >= split_bytes and not is_compressed(path)
+
+    def _read_chunks(self, path, file_bytes, data=None):
+        """
+        Returns an iterator of the dataframes read from a file, in file order.
+        - Files of at least load_options.split_bytes are split into byte ranges parsed in parallel processes
+        - The members of zip archives are parsed in parallel processes
+        - Other files (including gzip and bzip2 files, which are decompressed as they are parsed)
+          are read in chunks of READ_CHUNK_ROWS (or all at once, by parsers other than pandas)
+        Files are parsed by the load_options.parser backend (falling back to pandas if it cannot read a file).
+        Either way, the iterator has a close() method.
+        Args:
+        path: The CSV file
+        file_bytes: The size of the file
+        data: The file's bytes if they have already been read (None to read the file)
+        """
+        parser = self.load_options.parser
+
+        if is_zip(path):
+            members = member_names(path)
+            get_module_logger().info("Parsing %d files from %s", len(members), path)
+            return self._read_parallel([(read_archive_member, (path, member, parser)) for member in members])
+
+        if self._is_split(path, file_bytes):
+            (header, ranges) = split_byte_ranges(path, RANGE_BYTES)
+            get_module_logger().info("Parsing %s in %d ranges", path, len(ranges))
+            return self._read_parallel(
+                [(read_csv_range, (path, header, start, end, parser)) for (start, end) in ranges])
+
+        # The file is closed when the iterator finishes or is closed
+        return parsers.read_chunks(lambda: open_member(path, data=data), parser, READ_CHUNK_ROWS)
 
-        for fcount, filename in enumerate(filenames):
+    def _read_parallel(self, jobs):
+        """
+        Generates the dataframes returned by a list of parsing jobs, in job order.
+        The jobs run in a pool of worker processes (unless load_options.parse_processes is 1).
+        Only a few jobs per process are run ahead, so memory use does not grow with the number of jobs.
+        Args:
+        jobs: List of (function, args) to run
+        """
+        processes = self.load_options.parse_processes or os.cpu_count() or 1
+        if processes == 1:
+            for (function, args) in jobs:
+                yield function(*args)
+            return
+
+        if self._parse_pool is None:
+            self._parse_pool = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+
+        jobs = iter(jobs)
+        pending = deque(
+            self._parse_pool.submit(function, *args) for (function, args) in itertools.islice(jobs, 2 * processes))
+
+        try:
+            while pending:
+                dataframe = pending.popleft().result()
+                for (function, args) in itertools.islice(jobs, 1):
+                    pending.append(self._parse_pool.submit(function, *args))
+                yield dataframe
+        finally:
+            # Stopped early (cancelled, or past the end of the date range)
+            for future in pending:
+                future.cancel()
+
+    def _get_files(self):
+        """
+        Returns (list of data file names, list of their sizes).
+        With a manifest, the manifest is brought up to date and the files are taken from it.
+        """
+        if self.manifest is not None:
+            try:
+                with timing.span("manifest.scan"):
+                    self.folder_changes = self.manifest.scan()
+                entries = self.manifest.entries()
+                return ([entry.filename for entry in entries], [entry.size for entry in entries])
+            except (sqlite3.Error, OSError) as exc:
+                get_module_logger().warning("Could not use folder manifest (%s)", exc)
+                self.manifest = None
+
+        filenames = get_csv_filenames(self.folder)
+        return (filenames, [os.path.getsize(os.path.join(self.folder, filename)) for filename in filenames])
+
+    def _select_files(self, filenames, file_sizes):
+        """
+        Returns (file names, sizes) of the files that have data in the date range (all of them if there is no range).
+        Each file's first and last timestamps come from the manifest, or from probing its first and last lines
+        (these are then kept in the manifest). Files whose times cannot be found are always read.
+        Args:
+        filenames: List of data file names
+        file_sizes: List of their sizes
+        """
+        if self.date_range is None:
+            return (filenames, file_sizes)
+
+        (first, after) = range_limits(*self.date_range)
+
+        bounds = {}
+        if self.manifest is not None:
+            bounds = {entry.filename:(entry.first, entry.last) for entry in self.manifest.entries()}
+
+        selected = ([], [])
+        with timing.span("select_files", files=len(filenames)) as select_span:
+            for filename, file_bytes in zip(filenames, file_sizes):
+                (file_first, file_last) = bounds.get(filename, (None, None))
+                if file_first is None or file_last is None:
+                    (file_first, file_last) = probe_time_bounds(os.path.join(self.folder, filename))
+                    self._record_bounds(filename, file_first, file_last)
+
+                if file_first is not None and file_last is not None:
+                    if (after is not None and file_first >= after) or (first is not None and file_last < first):
+                        continue
+
+                selected[0].append(filename)
+                selected[1].append(file_bytes)
 
-            # Create a dataframe for each CSV file and append to the frames list
+            self.skipped_files = len(filenames) - len(selected[0])
+            select_span.set(skipped=self.skipped_files)
 
-            full_path = os.path.join(self.folder, filename)
-            dataframe = pd.read_csv(full_path, parse_dates=[[1, 2]], dayfirst=True, index_col=0)
-            frames.append(dataframe)
+        get_module_logger().info(
+            "Reading %d of %d files in date range %s to %s", len(selected[0]), len(filenames), *self.date_range)
+        return selected
 
-            percent_complete = (fcount * 100) / total_file_count
-            self.queue.put(percent_complete)
+    def _record_file(self, filename, rows, first, last):
+        """
+        Records the rows and first and last timestamps of a completely read file in the manifest
+        Args:
+        filename: The file name
+        rows: Number of rows in the file
+        first, last: Timestamps of the first and last rows (None if the file had no rows)
+        """
+        if self.manifest is None:
+            return
 
-        self.queue.put(EVT_DATA_LOAD_COMPLETE)
+        (first, last) = [
+            timestamp.to_pydatetime() if isinstance(timestamp, pd.Timestamp) and not pd.isnull(timestamp) else None
+            for timestamp in (first, last)]
+
+        try:
+            self.manifest.record(filename, rows, first, last)
+        except sqlite3.Error as exc:
+            get_module_logger().warning("Could not update folder manifest for %s (%s)", filename, exc)
+
+    def _record_bounds(self, filename, first, last):
+        """ Records the probed first and last timestamps of a file in the manifest (if they were found) """
+        if self.manifest is None or first is None or last is None:
+            return
+
+        try:
+            self.manifest.record_bounds(filename, first, last)
+        except sqlite3.Error as exc:
+            get_module_logger().warning("Could not update folder manifest for %s (%s)", filename, exc)
+
+    def _process(self, frames):
+        """
+        Merge the dataframes read from file, split them into fields and apply conversions and limits
+        Args:
+        frames: List of dataframes read from file
+        """
+
+        self._report_progress(STAGE_PROCESSING, 0)
 
         # All dataframes created, now merge them and sort by time
-        data = pd.concat(frames)
-        data.sort_index(inplace=True)
+        with timing.span("concat_and_sort") as concat_span:
+            data = pd.concat(frames)
+            data.sort_index(inplace=True)
+            concat_span.set(rows=len(data))
 
-        self.queue.put(20)
+        self._check_cancelled()
+        self._report_progress(STAGE_PROCESSING, 20)
 
         # Strip any whitespace from the column names
         data.rename(columns=lambda x: x.strip(), inplace=True)
 
-        self.queue.put(40)
+        self._report_progress(STAGE_PROCESSING, 40)
 
         # Split data into seperate dataframes (ignoring reference field)
-        column_names = list(data.columns.values)[1:]
-        self.dataframes = {}
-        for col in column_names:
-            self.dataframes[col] = pd.DataFrame(data[col], index=data.index)
+        with timing.span("split_fields"):
+            column_names = list(data.columns.values)[1:]
+            self.dataframes = {}
+            for col in column_names:
+                self.dataframes[col] = pd.DataFrame(data[col], index=data.index)
 
-        self.queue.put(60)
+        self._check_cancelled()
+        self._report_progress(STAGE_PROCESSING, 60)
 
         # Apply any special data conversions
-        self.convert_dataframes()
+        with timing.span("convert_dataframes"):
+            self.convert_dataframes()
 
-        self.queue.put(80)
+        self._check_cancelled()
+        self._report_progress(STAGE_PROCESSING, 80)
 
         # The fields are fixed, so save them to a member now rather than compute each time
         self._set_fieldnames(column_names)
@@ -155,11 +857,24 @@ class DataManager(threading.Thread):
         self._set_numeric_fields()
 
         # Apply any user-specified limits
-        self.limit_dataframes()
+        with timing.span("limit_dataframes"):
+            self.limit_dataframes()
 
-        # Signal to main thread that data load and conversion is complete
-        self.queue.put(100)
-        self.queue.put(EVT_DATA_PROCESSING_COMPLETE)
+        self._check_cancelled()
+
+        # Precompute per-day windrose tables and histograms, so they are instant for any date range
+        with timing.span("daily_tables"):
+            # Fields usually share one index, so each distinct index is split into days once
+            day_indices_cache = {}
+            self._set_daily_wind_table(day_indices_cache)
+            self._set_histograms(day_indices_cache)
+
+        # Only a few fields are shown at once, so keep the fields in a cache that spills
+        # least recently used fields to disk when they are over the memory budget
+        with timing.span("column_cache"):
+            column_cache = ColumnCache(self.cache_budget, self.spill_dir)
+            column_cache.update(self.dataframes)
+            self.dataframes = column_cache
 
     def convert_dataframes(self):
         """
@@ -167,12 +882,14 @@ class DataManager(threading.Thread):
         """
         for key, dataframe in self.dataframes.items():
             try:
-                self.dataframes[key] = self.special_fields[key].convert(dataframe)
-                get_module_logger().info("Applied special conversion to field '%s'", key)
+                special_field = self.special_fields[key]
             except KeyError:
                 get_module_logger().info("No special conversion exists for field '%s'", key)
-            except:
-                raise
+                continue
+
+            with timing.span("%s.convert" % type(special_field).__name__, field=key, rows=len(dataframe)):
+                self.dataframes[key] = special_field.convert(dataframe)
+            get_module_logger().info("Applied special conversion to field '%s'", key)
 
     def limit_dataframes(self):
         """
@@ -214,42 +931,172 @@ class DataManager(threading.Thread):
 
         self._numeric_fields = [list(frame.columns.values)[0] for frame in frames]
 
-    def get_timestamps(self, display_name):
-        """ Return timestamps (the dataframe index) for the requested series """
+    def memory_report(self):
+        """
+        Returns a MemoryReport of the memory used by each field and by the precomputed tables.
+        Only fields in memory are listed (fields spilled to disk are counted in the column cache stats).
+        An index object used by several fields is only counted for the first of them.
+        Equal indexes that are stored separately are each counted, and marked as duplicates.
+        """
+        fields = []
+        index_owners = {} # id of each index object -> the first field using it
+        distinct_indexes = [] # (field, index) of each separately stored index
+
+        resident = self.dataframes.resident_items() if self.dataframes is not None else []
+
+        for field_name, dataframe in sorted(resident, key=lambda item: item[0]):
+            index = dataframe.index
+
+            values = dataframe[field_name].values.nbytes
+            objects = int(dataframe.memory_usage(index=False, deep=True)[field_name]) - values
+
+            shared_with = index_owners.get(id(index))
+            duplicate_of = None
+            if shared_with is None:
+                index_owners[id(index)] = field_name
+                index_bytes = index.nbytes
+                for (other_field, other_index) in distinct_indexes:
+                    if len(other_index) == len(index) and other_index.equals(index):
+                        duplicate_of = other_field
+                        break
+                distinct_indexes.append((field_name, index))
+            else:
+                index_bytes = 0
+
+            fields.append(FieldMemory(
+                field_name, len(dataframe), values, index_bytes, objects, shared_with, duplicate_of))
+
+        tables = []
+        if self.daily_wind_table is not None:
+            tables.append(("Daily windrose table", self.daily_wind_table.nbytes()))
+        if self.histograms:
+            tables.append(("Daily histograms", sum(histogram.nbytes() for histogram in self.histograms.values())))
+
+        column_cache = self.dataframes.stats() if self.dataframes is not None else None
+        return MemoryReport(fields, tables, column_cache)
+
+    def get_timestamps(self, display_name, start=None, end=None):
+        """ Return timestamps (the dataframe index) for the requested series
+        Args:
+        display_name : The display name of the dataset
+        start : Only return timestamps from this time on (see time_range_slice), or None for no limit
+        end : Only return timestamps up to this time (see time_range_slice), or None for no limit
+        """
         field_name = self._display_to_field_dict[display_name]
-        return self.dataframes[field_name].index
+        index = self.dataframes[field_name].index
+        if start is None and end is None:
+            return index
+
+        return index[time_range_slice(index, start, end)]
 
     def has_dataset(self, display_name):
         """ Return true if dataset with this name exists in datasets """
         return display_name in self._display_to_field_dict.keys()
 
-    def get_dataset(self, display_name):
-        """ Return data for the requested series """
+    def get_dataset(self, display_name, start=None, end=None):
+        """ Return data for the requested series
+        Args:
+        display_name : The display name of the dataset
+        start : Only return data from this time on (see time_range_slice), or None for no limit
+        end : Only return data up to this time (see time_range_slice), or None for no limit
+        """
         field_name = self._display_to_field_dict[display_name]
-        return self.dataframes[field_name][field_name].values
+        dataframe = self.dataframes[field_name]
+        if start is None and end is None:
+            return dataframe[field_name].values
 
-    def get_dataset_average(self, display_name, average_time_seconds):
-        """ Use resampling functionality to get average of dataset over requested number of seconds """
+        return dataframe[field_name].values[time_range_slice(dataframe.index, start, end)]
+
+    def get_dataset_average(self, display_name, average_time_seconds, start=None, end=None):
+        """ Use resampling functionality to get average of dataset over requested number of seconds
+        Args:
+        display_name : The display name of the dataset
+        average_time_seconds : The averaging period
+        start : Only average data from this time on (see time_range_slice), or None for no limit
+        end : Only average data up to this time (see time_range_slice), or None for no limit
+        """
         field_name = self._display_to_field_dict[display_name]
-        resampled_data = self.dataframes[field_name].resample("%dS" % average_time_seconds, how='mean')
+        dataframe = self.dataframes[field_name]
+        if start is not None or end is not None:
+            dataframe = dataframe.iloc[time_range_slice(dataframe.index, start, end)]
+
+        with timing.span("resample", field=field_name, rows=len(dataframe)):
+            resampled_data = dataframe.resample("%dS" % average_time_seconds, how='mean')
         # Resampled data is placed at start of time periods. Re-index to middle of periods.
         new_index = resampled_data.index + timedelta(seconds=average_time_seconds/2)
         resampled_data.index = new_index
 
         return (list(resampled_data[field_name].values), list(resampled_data[field_name].index))
 
-    def len(self, display_name):
+    def _set_daily_wind_table(self, day_indices_cache):
+        """ Builds the per-day windrose table if matching wind speed and direction data exists
+        Args:
+        day_indices_cache : dict used by cached_day_indices
+        """
+        if self.has_dataset("Wind Speed") and self.has_dataset("Direction") and \
+            self.len("Direction") == self.len("Wind Speed"):
+            # Not kept once the table is built: it refers to the speed and direction data,
+            # which would stop those fields being freed when they are spilled from the column cache
+            wind_histogram = WindHistogram(self.get_dataset("Direction"), self.get_dataset("Wind Speed"))
+            (speed_min, speed_max) = wind_histogram.var_range()
+            timestamps = self.get_timestamps("Wind Speed")
+            self.daily_wind_table = DailyWindTable(
+                wind_histogram, timestamps, np.linspace(speed_min, speed_max, WINDROSE_BIN_COUNT),
+                WINDROSE_SECTOR_COUNT, cached_day_indices(timestamps, day_indices_cache))
+
+    def _set_histograms(self, day_indices_cache):
+        """ Builds the per-day histogram of each numeric field
+        Args:
+        day_indices_cache : dict used by cached_day_indices
+        """
+        self.histograms = {}
+        for field_name in self._numeric_fields:
+            dataframe = self.dataframes[field_name]
+            self.histograms[field_name] = DailyHistogram(
+                dataframe[field_name].values, dataframe.index, HISTOGRAM_BIN_COUNT,
+                cached_day_indices(dataframe.index, day_indices_cache))
+
+    def get_histogram(self, display_name, start=None, end=None):
+        """ Returns (counts, bin edges) of a dataset for the days between start and end (inclusive)
+        Args:
+        display_name : The display name of the dataset
+        start : The first day (datetime.date) or None to start from the first day of data
+        end : The last day (datetime.date) or None to finish at the last day of data
+        """
+        histogram = self.histograms[self._display_to_field_dict[display_name]]
+        return (histogram.counts(start, end), histogram.edges)
+
+    def get_windrose_table(self, start=None, end=None):
+        """ Returns the windrose table for the days between start and end (inclusive)
+        Args:
+        start : The first day (datetime.date) or None to start from the first day of data
+        end : The last day (datetime.date) or None to finish at the last day of data
+        """
+        if self.daily_wind_table is None:
+            raise KeyError("No matching wind speed and direction data")
+
+        return self.daily_wind_table.between(start, end)
+
+    def len(self, display_name, start=None, end=None):
         """ Returns length of a dataframe
         Returns 0 if the requested frame does not exist
         Args:
         display_name : the dataframe to get length of
+        start : Only count rows from this time on (see time_range_slice), or None for no limit
+        end : Only count rows up to this time (see time_range_slice), or None for no limit
         """
         try:
             field_name = self._display_to_field_dict[display_name]
-            return len(self.dataframes[field_name][field_name])
+            index = self.dataframes[field_name].index
         except KeyError:
             return 0
 
+        if start is None and end is None:
+            return len(index)
+
+        rows = time_range_slice(index, start, end)
+        return rows.stop - rows.start
+
     def _get_all_display_names(self):
         """ Returns a list of display names from the dictionary """
         return list(self._field_to_display_dict.values())
@@ -288,5 +1135,63 @@ class DataManager(threading.Thread):
 
     @staticmethod
     def directory_has_data_files(directory):
-        """ Returns True if directory has at least one .csv or .CSV file """
-        return True in [".csv" in filename.lower() for filename in os.listdir(directory)]
+        """ Returns True if directory has at least one .csv or .CSV file (or compressed CSV file) """
+        return any(valid_filename(filename) for filename in os.listdir(directory))
+
+class DataManagerThread(threading.Thread):
+
+    """
+    Loads a DataManager in a separate thread to the rest of the application,
+    so that the application can show progress during long loads.
+
+    Messages are put on a queue for the application to read:
+    ProgressEvents as loading progresses, EVT_DATA_LOAD_COMPLETE once the files have been read,
+    and finally EVT_DATA_PROCESSING_COMPLETE (or EVT_DATA_LOAD_CANCELLED if loading was cancelled,
+    or EVT_DATA_NOT_IN_RANGE if there was no data in the date range).
+    """
+
+    def __init__( #pylint: disable=too-many-arguments
+            self, msg_queue, folder, config, cache_budget=None, spill_dir=None, manifest=None, date_range=None,
+            load_options=None):
+        """
+        Args:
+        msg_queue: The queue to put messages on
+        folder: The folder of CSV files to load
+        config: Dataset configuration (see DataManager)
+        cache_budget: Bytes of field data to keep in memory (see DataManager)
+        spill_dir: Folder for the spill file (see DataManager)
+        manifest: Folder manifest to scan and update (see DataManager)
+        date_range: (start, end) to load (see DataManager)
+        load_options: LoadOptions for reading files (see DataManager)
+        """
+        threading.Thread.__init__(self)
+        self.queue = msg_queue
+        self.data_manager = DataManager(
+            folder, config, cache_budget, spill_dir, manifest, date_range, load_options)
+        self._files_read = False
+
+    def cancel(self, keep_partial=False):
+        """ Asks the data manager to stop loading (see DataManager.cancel) """
+        self.data_manager.cancel(keep_partial)
+
+    def run(self):
+        """ Loads the data manager, sending messages to the queue """
+        try:
+            self.data_manager.load(self._put_progress)
+        except NoDataInRange:
+            self.queue.put(EVT_DATA_NOT_IN_RANGE)
+            return
+        except LoadCancelled:
+            self.queue.put(EVT_DATA_LOAD_CANCELLED)
+            return
+
+        # Signal to main thread that data load and conversion is complete
+        self.queue.put(EVT_DATA_PROCESSING_COMPLETE)
+
+    def _put_progress(self, event):
+        """ Puts a progress event on the queue, preceded by EVT_DATA_LOAD_COMPLETE when processing starts """
+        if event.stage == STAGE_PROCESSING and not self._files_read:
+            self._files_read = True
+            self.queue.put(EVT_DATA_LOAD_COMPLETE)
+
+        self.queue.put(event)
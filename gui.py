@@ -10,12 +10,6 @@ Defines a GUI for the CSV viewer application
 import os
 import logging
 
-import matplotlib
-matplotlib.use('TkAgg')
-
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2TkAgg
-from matplotlib.figure import Figure
-
 import tkinter as Tk
 from tkinter import messagebox, filedialog
 
@@ -23,6 +17,24 @@ from app_reqs import REQS
 
 from tk_helpers import TkOptionMenuHelper, TkLabelledEntryHelper, TkProgressBarHelper
 import app_info
+import timing
+
+# Size (in inches) of the figure in the main window
+MAIN_FIGURE_SIZE = (8, 5)
+
+def import_matplotlib():
+    """
+    Imports matplotlib with the Tk backend and returns (Figure, FigureCanvasTkAgg, NavigationToolbar2TkAgg).
+    This is done when the first figure is made rather than at startup, so the main window appears sooner.
+    """
+    #pylint: disable=import-outside-toplevel
+    import matplotlib
+    matplotlib.use('TkAgg')
+
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2TkAgg
+    from matplotlib.figure import Figure
+
+    return (Figure, FigureCanvasTkAgg, NavigationToolbar2TkAgg)
 
 def run_gui():
     """ Entry point into the GUI, from which there is no return until _exit() is called """
@@ -42,6 +54,16 @@ def ask_directory(title):
 
     return filedialog.askdirectory(title=title)
 
+def ask_save_filename(title, extension):
+    """
+    Brings up Tk asksaveasfilename window and returns resulting path ('' if cancelled)
+    Args:
+    title: The title for the dialog
+    extension: The default file extension (e.g. ".json")
+    """
+
+    return filedialog.asksaveasfilename(title=title, defaultextension=extension)
+
 def show_info_dialog(text):
     """
     Show a Tk messagebox
@@ -142,7 +164,8 @@ class GUI:
         def __init__(
                 self, subplot_select_dropdowns, dataset_dropdown,
                 average_text_entry, average_period_dropdown, average_button, average_reset_button,
-                special_option_dropdown, special_option_button):
+                special_option_dropdown, special_date_entries, special_option_button,
+                view_range_entries, view_range_button):
             """
             Args:
             master: The frame to draw on
@@ -153,7 +176,10 @@ class GUI:
             average_button: The button to apply selected averaging
             average_reset_button: The button to reset averaging (display raw data)
             special_option_dropdown: The dropdown to select any special operations to perform
+            special_date_entries: The (from, to) text entries for the special operation date range
             special_option_button: The button to perform and special operations
+            view_range_entries: The (from, to) text entries for the date range shown on all plots
+            view_range_button: The button to apply the view date range
 
             pylint too-many-arguments is disabled. This is a simple container class.
             """
@@ -164,7 +190,10 @@ class GUI:
             self.average_button = average_button
             self.average_reset_button = average_reset_button
             self.special_option_dropdown = special_option_dropdown
+            self.special_date_entries = special_date_entries
             self.special_option_button = special_option_button
+            self.view_range_entries = view_range_entries
+            self.view_range_button = view_range_button
 
         def get_subplot_list(self):
             """ Return a list of selected subplots """
@@ -186,6 +215,14 @@ class GUI:
             """ Returns the current selected special action """
             return self.special_option_dropdown.var.get()
 
+        def get_special_date_range(self):
+            """ Returns the (from, to) text of the special action date range entries """
+            return tuple(entry.var.get().strip() for entry in self.special_date_entries)
+
+        def get_view_range(self):
+            """ Returns the (from, to) text of the view date range entries """
+            return tuple(entry.var.get().strip() for entry in self.view_range_entries)
+
         def set_dataset_choices(self, datasets):
             """ Sets the dataset dropdown options """
             self.dataset_dropdown.set_options(datasets)
@@ -195,13 +232,20 @@ class GUI:
             if options is not None:
                 self.special_option_dropdown.set_options(options)
                 self.special_option_dropdown.pack(**kwargs)
+                for entry in self.special_date_entries:
+                    entry.pack(**kwargs)
                 self.special_option_button.pack(**kwargs)
             else:
                 self.special_option_dropdown.pack_forget()
+                for entry in self.special_date_entries:
+                    entry.pack_forget()
                 self.special_option_button.pack_forget()
 
         def pack(self, **kwargs): #pylint: disable=star-args
             """ Draws the objects on the frame """
+            for entry in self.view_range_entries:
+                entry.pack(**kwargs)
+            self.view_range_button.pack(**kwargs)
             self.dataset_dropdown.pack(**kwargs)
             self.average_text_entry.pack(**kwargs)
             self.average_period_dropdown.pack(**kwargs)
@@ -330,17 +374,69 @@ class GUI:
             TkOptionMenuHelper(
                 self.main_window_frames.data_controls_subframes[2],
                 "Special Options", ["Special Options"], command=None),
+            (
+                TkLabelledEntryHelper(
+                    self.main_window_frames.data_controls_subframes[2],
+                    {"text":"From (YYYY-MM-DD):"},
+                    {"side":Tk.LEFT, "padx":2, "pady":2},
+                    width=10),
+                TkLabelledEntryHelper(
+                    self.main_window_frames.data_controls_subframes[2],
+                    {"text":"To:"},
+                    {"side":Tk.LEFT, "padx":2, "pady":2},
+                    width=10),
+            ),
             Tk.Button(
                 self.main_window_frames.data_controls_subframes[2],
                 text='Show',
-                command=lambda: self.application_request(REQS.SPECIAL_OPTION))
+                command=lambda: self.application_request(REQS.SPECIAL_OPTION)),
+            (
+                TkLabelledEntryHelper(
+                    self.main_window_frames.data_controls_subframes[0],
+                    {"text":"Show from (YYYY-MM-DD):"},
+                    {"side":Tk.LEFT, "padx":2, "pady":2},
+                    width=10),
+                TkLabelledEntryHelper(
+                    self.main_window_frames.data_controls_subframes[0],
+                    {"text":"To:"},
+                    {"side":Tk.LEFT, "padx":2, "pady":2},
+                    width=10),
+            ),
+            Tk.Button(
+                self.main_window_frames.data_controls_subframes[0],
+                text='Apply range',
+                command=lambda: self.application_request(REQS.SET_VIEW_RANGE))
         )
 
         self.progress_bar = None
+        self.progress_details = None
 
         self.ui_exists = False
 
-        self.add_new_window('Main', (8, 5))
+        # Figures waiting to be drawn on the next idle cycle (figure key -> plotter)
+        # and the number of times each figure has actually been rendered.
+        self.dirty_figures = {}
+        self.render_counts = {}
+
+        # The main figure is added when it is first drawn (see _render)
+        self.add_new_window('Main', MAIN_FIGURE_SIZE, add_figure=False)
+
+        # Optional date range for "Open CSV Folder": files entirely outside it are not read
+        self.load_range_entries = (
+            TkLabelledEntryHelper(
+                self.main_window_frames.application,
+                {"text":"Load from (YYYY-MM-DD):"},
+                {"padx":10},
+                width=10),
+            TkLabelledEntryHelper(
+                self.main_window_frames.application,
+                {"text":"To:"},
+                {"padx":10},
+                width=10),
+        )
+
+        for entry in self.load_range_entries:
+            entry.pack(padx=10)
 
         self.new_data_button = Tk.Button(
             self.main_window_frames.application,
@@ -356,6 +452,13 @@ class GUI:
 
         self.about_button.pack(padx=10, pady=10)
 
+        self.diagnostics_button = Tk.Button(
+            self.main_window_frames.application,
+            text='Diagnostics',
+            command=lambda: self.application_request(REQS.DIAGNOSTICS_DIALOG))
+
+        self.diagnostics_button.pack(padx=10, pady=10)
+
         self.exit_button = Tk.Button(self.main_window_frames.application, text='Exit', command=self._exit)
         self.exit_button.pack(padx=10, pady=10)
 
@@ -364,6 +467,23 @@ class GUI:
         self.main_window_frames.plot_select.pack()
         self.main_window_frames.data_controls.pack()
 
+    def schedule(self, delay_ms, callback):
+        """
+        Calls a function from the Tk main loop after a delay
+        Args:
+        delay_ms: The delay in milliseconds
+        callback: The function to call (with no arguments)
+        """
+        self.root.after(delay_ms, callback)
+
+    def schedule_idle(self, callback):
+        """
+        Calls a function from the Tk main loop once pending events have been handled
+        Args:
+        callback: The function to call (with no arguments)
+        """
+        self.root.after_idle(callback)
+
     def reset_and_show_progress_bar(self, text):
         """
         Creates a new progress bar
@@ -382,6 +502,19 @@ class GUI:
 
         self.progress_bar.pack()
 
+        self.progress_details = Tk.Label(self.tk_handles.windows["Progress Bar"], text="")
+        self.progress_details.pack()
+
+        # Loading can be cancelled, either discarding everything or keeping what has been read so far
+        button_frame = self.tk_handles.frames["Progress Bar"]
+        Tk.Button(
+            button_frame, text="Cancel",
+            command=lambda: self.application_request(REQS.CANCEL_LOAD, False)).pack(side=Tk.LEFT, padx=10, pady=10)
+        Tk.Button(
+            button_frame, text="Stop and show loaded data",
+            command=lambda: self.application_request(REQS.CANCEL_LOAD, True)).pack(side=Tk.LEFT, padx=10, pady=10)
+        button_frame.pack()
+
     def set_progress_text(self, text):
         """
         Sets the progress bar text
@@ -399,6 +532,14 @@ class GUI:
 
         self.progress_bar.set(percent)
 
+    def set_progress_details(self, text):
+        """
+        Sets the line of detail text (e.g. throughput) shown under the progress bar
+        Args:
+        text: New text
+        """
+        self.progress_details.config(text=text)
+
     def hide_progress_bar(self):
         """
         Hides the progress bar
@@ -411,6 +552,8 @@ class GUI:
         Args:
         window: The window to kill
         """
+        # A figure in the window may be waiting to be drawn
+        self.dirty_figures.pop(window, None)
         try:
             self.tk_handles.windows[window].destroy()
         except KeyError:
@@ -429,15 +572,59 @@ class GUI:
         self.tk_handles.windows[key] = window
         self.tk_handles.frames[key] = Tk.Frame(window)
         if add_figure:
-            self.tk_handles.figures[key] = Figure(figsize=size, dpi=100)
+            self.add_figure(key, size, add_nav_toolbar)
 
-            self.tk_handles.canvases[key] = FigureCanvasTkAgg(
-                self.tk_handles.figures[key], master=window)
-            self.tk_handles.canvases[key].get_tk_widget().pack(side=Tk.TOP, fill=Tk.BOTH, expand=1)
-            if add_nav_toolbar:
-                self.tk_handles.toolbars[key] = NavigationToolbar2TkAgg(
-                    self.tk_handles.canvases[key], window)
-                self.tk_handles.toolbars[key].update()
+    def add_figure(self, key, size, add_nav_toolbar=True):
+        """
+        Adds a matplotlib figure to an existing window
+        Args:
+        key: The name of the window
+        size: (x, y) tuple of figure size in inches
+        add_nav_toolbar: True if a matplotlib toolbar should be added to the window.
+        """
+        (Figure, FigureCanvasTkAgg, NavigationToolbar2TkAgg) = import_matplotlib() #pylint: disable=invalid-name
+
+        window = self.tk_handles.windows[key]
+
+        # The main window's controls are already packed, so keep the figure above them
+        pack_position = {"before":self.main_window_frames.control} if key == "Main" else {}
+
+        self.tk_handles.figures[key] = Figure(figsize=size, dpi=100)
+
+        self.tk_handles.canvases[key] = FigureCanvasTkAgg(
+            self.tk_handles.figures[key], master=window)
+        self.tk_handles.canvases[key].get_tk_widget().pack(
+            side=Tk.TOP, fill=Tk.BOTH, expand=1, **pack_position)
+        if add_nav_toolbar:
+            self.tk_handles.toolbars[key] = NavigationToolbar2TkAgg(
+                self.tk_handles.canvases[key], window)
+            self.tk_handles.toolbars[key].update()
+            self.tk_handles.toolbars[key].pack_configure(**pack_position)
+
+    def show_text_window(self, key, text, actions=None):
+        """
+        Shows a window of read-only text with an optional row of buttons,
+        replacing any existing window with the same key
+        Args:
+        key: The name of the window (also used in its title)
+        text: The text to show
+        actions: List of (button text, callback) tuples
+        """
+        self.kill_window(key)
+        self.add_new_window(key, None, add_figure=False)
+
+        window = self.tk_handles.windows[key]
+        window.wm_title("%s - %s" % (app_info.TITLE, key))
+
+        text_box = Tk.Text(window, width=100, height=30, font="TkFixedFont")
+        text_box.insert(Tk.END, text)
+        text_box.config(state=Tk.DISABLED)
+        text_box.pack(side=Tk.TOP, fill=Tk.BOTH, expand=1)
+
+        button_frame = self.tk_handles.frames[key]
+        for (button_text, callback) in actions or []:
+            Tk.Button(button_frame, text=button_text, command=callback).pack(side=Tk.LEFT, padx=10, pady=10)
+        button_frame.pack()
 
     def get_figure(self, key):
         """
@@ -476,6 +663,22 @@ class GUI:
         """ Returns the current selected special action """
         return self.dataset_controls.get_special_action()
 
+    def get_special_date_range(self):
+        """ Returns the (from, to) date range text for special actions (empty strings if not set) """
+        return self.dataset_controls.get_special_date_range()
+
+    def get_displayed_fields(self):
+        """ Returns a list of the display name shown on each subplot (None if not set) """
+        return list(self.dataset_controls.get_subplot_list())
+
+    def get_view_range(self):
+        """ Returns the (from, to) date range text for all plots (empty strings if not set) """
+        return self.dataset_controls.get_view_range()
+
+    def get_load_range(self):
+        """ Returns the (from, to) date range text for opening a folder (empty strings if not set) """
+        return tuple(entry.var.get().strip() for entry in self.load_range_entries)
+
     def set_dataset_choices(self, datasets):
         """ Sets the list of possible datasets that can be selected for each plot
         Args:
@@ -524,18 +727,70 @@ class GUI:
         return self.dataset_controls.get_subplot_index_for_dataset(display_name)
 
     def draw(self, plotter, figure_key='Main'):
-        """ Draw the a plot on a figure
+        """ Mark a figure as needing to be drawn.
+        The figure is rendered once on the next Tk idle cycle, however many times
+        it is marked dirty before then.
         Args:
         plotter: The plotter object that will do the drawing
         figure_key: The key of the figure on which to plot
         """
+        if not self.dirty_figures:
+            self.root.after_idle(self._draw_dirty_figures)
+
+        self.dirty_figures[figure_key] = plotter
+
+    def draw_now(self, plotter, figure_key='Main'):
+        """ Draw a plot on a figure immediately, bypassing the idle scheduler.
+        Any exception raised by the plotter is passed on to the caller.
+        Args:
+        plotter: The plotter object that will do the drawing
+        figure_key: The key of the figure on which to plot
+        """
+        self.dirty_figures.pop(figure_key, None)
+        self._render(plotter, figure_key)
+
+    def get_render_count(self, figure_key='Main'):
+        """ Returns the number of times a figure has been rendered
+        Args:
+        figure_key: The key of the figure of interest
+        """
+        return self.render_counts.get(figure_key, 0)
+
+    def _draw_dirty_figures(self):
+        """ Idle callback: renders each figure that has been marked dirty """
+        dirty_figures = self.dirty_figures
+        self.dirty_figures = {}
+
+        for figure_key, plotter in dirty_figures.items():
+            # The window may have been closed since the figure was marked dirty
+            window = self.tk_handles.windows.get(figure_key)
+            if window is not None and not window.winfo_exists():
+                get_module_logger().info("Not drawing figure '%s': its window has been closed", figure_key)
+                continue
+
+            self._render(plotter, figure_key)
+
+    def _render(self, plotter, figure_key):
+        """ Draw the a plot on a figure and update its canvas
+        Args:
+        plotter: The plotter object that will do the drawing
+        figure_key: The key of the figure on which to plot
+        """
+        if figure_key not in self.tk_handles.figures:
+            self.add_figure(figure_key, MAIN_FIGURE_SIZE)
+
         current_subplots = self.dataset_controls.get_subplot_list()
         styles = [
             self.application_request(REQS.GET_PLOTTING_STYLE, display_name) for display_name in current_subplots
         ]
 
-        plotter.draw(self.tk_handles.figures[figure_key], styles)
-        self.tk_handles.canvases[figure_key].draw()
+        with timing.span("%s.draw" % type(plotter).__name__, figure=figure_key):
+            plotter.draw(self.tk_handles.figures[figure_key], styles)
+
+        with timing.span("FigureCanvasTkAgg.draw", figure=figure_key):
+            self.tk_handles.canvases[figure_key].draw()
+
+        self.render_counts[figure_key] = self.get_render_count(figure_key) + 1
 
     def _exit(self):
         """
@@ -0,0 +1,320 @@
+"""
+manifest.py
+
+@author: James Fowkes
+
+A persistent manifest of the data files in a folder, kept in a small SQLite database in a cache folder.
+
+For each file it records the size, modification time, a content hash, the header columns and
+(once the file has been parsed) the number of rows and the first and last timestamps.
+The manifest is updated incrementally: only new or modified files are looked at again.
+
+This lets a folder be summarised (files, rows, date range) without reading it,
+and shows which files have been added, changed or removed since the folder was last loaded.
+"""
+
+import os
+import sys
+import hashlib
+import logging
+import sqlite3
+
+from collections import namedtuple
+from contextlib import closing
+from datetime import datetime
+
+from app_info import TITLE
+from archives import COMPRESSED_EXTENSIONS, ARCHIVE_ERRORS, read_first_line
+
+# Bump this if the table layout changes: older manifests are then discarded and rebuilt
+SCHEMA_VERSION = 1
+
+# The content hash covers this many bytes from the start and end of each file (and the file size)
+HASH_SAMPLE_BYTES = 65536
+
+# Format of timestamps in the manifest (sortable text)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# Extensions of files that contain data
+DATA_FILE_EXTENSIONS = (".csv",) + COMPRESSED_EXTENSIONS
+
+def get_module_logger():
+
+    """ Returns logger for this module """
+    return logging.getLogger(__name__)
+
+def is_data_file(filename):
+    """ Returns True if the filename has one of the DATA_FILE_EXTENSIONS (in any case) """
+    return filename.lower().endswith(DATA_FILE_EXTENSIONS)
+
+def user_cache_dir():
+    """ Returns the folder this application keeps cached files in, for the current user """
+    if sys.platform.startswith("win"):
+        base_dir = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    elif sys.platform == "darwin":
+        base_dir = os.path.expanduser("~/Library/Caches")
+    else:
+        base_dir = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+
+    return os.path.join(base_dir, TITLE.replace(" ", ""))
+
+def sample_hash(path, size):
+    """
+    Returns a hash of a file's size and its first and last HASH_SAMPLE_BYTES.
+    This is much cheaper than hashing the whole file, and is enough to tell
+    a file that has been appended to or replaced from one that has just been copied or touched.
+    Args:
+    path: The file to hash
+    size: The size of the file
+    """
+    file_hash = hashlib.sha1(str(size).encode("ascii"))
+    with open(path, "rb") as data_file:
+        file_hash.update(data_file.read(HASH_SAMPLE_BYTES))
+        if size > HASH_SAMPLE_BYTES:
+            data_file.seek(max(HASH_SAMPLE_BYTES, size - HASH_SAMPLE_BYTES))
+            file_hash.update(data_file.read(HASH_SAMPLE_BYTES))
+    return file_hash.hexdigest()
+
+def read_header(path):
+    """
+    Returns the list of column names in the first line of a CSV file (or the first CSV file in a zip archive).
+    Returns an empty list if a compressed file cannot be read.
+    """
+    try:
+        line = read_first_line(path).decode("utf8", "replace")
+    except ARCHIVE_ERRORS:
+        return []
+    return [column.strip() for column in line.split(",")] if line.strip() else []
+
+def timestamp_to_text(timestamp):
+    """ Returns a datetime as sortable text for the manifest (None stays None) """
+    return None if timestamp is None else timestamp.strftime(TIMESTAMP_FORMAT)
+
+def text_to_timestamp(text):
+    """ Returns a datetime from manifest text (None stays None) """
+    return None if text is None else datetime.strptime(text, TIMESTAMP_FORMAT)
+
+class ManifestEntry(namedtuple(
+        "ManifestEntry", ["filename", "size", "mtime_ns", "content_hash", "columns", "rows", "first", "last"])):
+
+    """
+    What the manifest knows about one data file.
+    filename: The file name (within the folder)
+    size: File size in bytes
+    mtime_ns: Modification time in nanoseconds
+    content_hash: See sample_hash
+    columns: List of column names from the file's header
+    rows: Number of rows parsed from the file (None if it has not been parsed since it last changed)
+    first: datetime of the first row (None if not known)
+    last: datetime of the last row (None if not known)
+    """
+
+    __slots__ = ()
+
+    @property
+    def parsed(self):
+        """ True if the file has been parsed since it last changed """
+        return self.rows is not None
+
+class ManifestChanges(namedtuple("ManifestChanges", ["added", "changed", "removed", "unchanged"])):
+
+    """
+    Lists of file names that have changed since a folder was last scanned.
+    added: Files that were not in the manifest
+    changed: Files whose size or content has changed
+    removed: Files in the manifest that no longer exist
+    unchanged: Files that have not changed
+    """
+
+    __slots__ = ()
+
+    @property
+    def has_changes(self):
+        """ True if any file was added, changed or removed """
+        return bool(self.added or self.changed or self.removed)
+
+class FolderSummary(namedtuple("FolderSummary", ["files", "bytes", "rows", "first", "last", "unparsed", "columns"])):
+
+    """
+    Summary of a folder from its manifest.
+    files: Number of data files
+    bytes: Total size of the data files
+    rows: Total rows of the parsed files
+    first: datetime of the earliest row of the files whose times are known (None if none are known)
+    last: datetime of the latest row of the files whose times are known
+    unparsed: Number of files that have not been parsed since they last changed (so are not in rows)
+    columns: List of every column name in the files' headers, in the order they are first seen
+    """
+
+    __slots__ = ()
+
+def describe_summary(summary):
+    """ Returns a line of text describing a FolderSummary """
+    text = "%d files, %.1f MB, %d rows" % (summary.files, summary.bytes / 1e6, summary.rows)
+    if summary.first is not None:
+        text += ", %s to %s" % (summary.first.strftime("%Y-%m-%d %H:%M"), summary.last.strftime("%Y-%m-%d %H:%M"))
+    if summary.unparsed:
+        text += " (%d files not yet parsed)" % summary.unparsed
+    return text
+
+class FolderManifest:
+
+    """
+    The manifest of one data folder.
+
+    Compressed files are hashed as they are, so they only need to be decompressed when they are parsed
+    (a date range load can then skip them using the times recorded by record).
+
+    Each folder has its own database file in the cache folder, named from a hash of the folder's path.
+    A new connection is made for each operation, so the manifest can be used from any thread
+    (e.g. scanned and updated by a loading thread while the GUI reads its summary).
+    """
+
+    def __init__(self, folder, cache_dir=None):
+        """
+        Raises sqlite3.Error or OSError if the manifest database cannot be created or opened.
+        Args:
+        folder: The data folder
+        cache_dir: Folder to keep the manifest database in (None for the user's cache folder)
+        """
+        self.folder = os.path.abspath(folder)
+
+        manifest_dir = os.path.join(cache_dir if cache_dir else user_cache_dir(), "manifests")
+        os.makedirs(manifest_dir, exist_ok=True)
+
+        folder_hash = hashlib.sha1(os.path.normcase(self.folder).encode("utf8")).hexdigest()[:16]
+        self.path = os.path.join(manifest_dir, "%s.sqlite" % folder_hash)
+
+        self._create_tables()
+
+    def _connect(self):
+        """ Returns a new connection to the manifest database """
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _create_tables(self):
+        """ Creates the manifest tables, discarding any manifest with an older layout """
+        with closing(self._connect()) as connection, connection:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != SCHEMA_VERSION:
+                connection.execute("DROP TABLE IF EXISTS files")
+                connection.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "filename TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, content_hash TEXT, columns TEXT, "
+                "rows INTEGER, first TEXT, last TEXT)")
+
+    def scan(self):
+        """
+        Brings the manifest up to date with the files in the folder and returns ManifestChanges.
+        Only new files and files whose size or modification time have changed are read (to hash them).
+        A file with a new modification time but the same size and hash keeps its parsed details.
+        """
+        stats = {}
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and is_data_file(entry.name):
+                stats[entry.name] = entry.stat()
+
+        known = {entry.filename:entry for entry in self.entries()}
+
+        changes = ManifestChanges([], [], sorted(set(known) - set(stats)), [])
+
+        with closing(self._connect()) as connection, connection:
+            connection.executemany("DELETE FROM files WHERE filename = ?", [(name,) for name in changes.removed])
+
+            for filename in sorted(stats):
+                (size, mtime_ns) = (stats[filename].st_size, stats[filename].st_mtime_ns)
+                entry = known.get(filename)
+
+                if entry is not None and (entry.size, entry.mtime_ns) == (size, mtime_ns):
+                    changes.unchanged.append(filename)
+                    continue
+
+                full_path = os.path.join(self.folder, filename)
+                content_hash = sample_hash(full_path, size)
+
+                if entry is not None and (entry.size, entry.content_hash) == (size, content_hash):
+                    # Touched or copied, but the content is the same
+                    connection.execute("UPDATE files SET mtime_ns = ? WHERE filename = ?", (mtime_ns, filename))
+                    changes.unchanged.append(filename)
+                    continue
+
+                (changes.added if entry is None else changes.changed).append(filename)
+                connection.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, NULL, NULL, NULL)",
+                    (filename, size, mtime_ns, content_hash, ",".join(read_header(full_path))))
+
+        if changes.has_changes:
+            get_module_logger().info(
+                "%s: %d new, %d changed, %d removed files", self.folder,
+                len(changes.added), len(changes.changed), len(changes.removed))
+
+        return changes
+
+    def record(self, filename, rows, first, last):
+        """
+        Records the details of a file that has been parsed
+        Args:
+        filename: The file name (which must already have been found by scan)
+        rows: Number of rows parsed
+        first: datetime of the first row (None if there were no rows)
+        last: datetime of the last row (None if there were no rows)
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "UPDATE files SET rows = ?, first = ?, last = ? WHERE filename = ?",
+                (rows, timestamp_to_text(first), timestamp_to_text(last), filename))
+
+    def record_bounds(self, filename, first, last):
+        """
+        Records the first and last timestamps of a file found without parsing it (e.g. from its first and last lines).
+        The row count is left as it is.
+        Args:
+        filename: The file name (which must already have been found by scan)
+        first: datetime of the first row
+        last: datetime of the last row
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "UPDATE files SET first = ?, last = ? WHERE filename = ?",
+                (timestamp_to_text(first), timestamp_to_text(last), filename))
+
+    def entries(self):
+        """ Returns a list of ManifestEntry, sorted by file name """
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT filename, size, mtime_ns, content_hash, columns, rows, first, last "
+                "FROM files ORDER BY filename").fetchall()
+
+        return [
+            ManifestEntry(
+                filename, size, mtime_ns, content_hash, columns.split(",") if columns else [],
+                row_count, text_to_timestamp(first), text_to_timestamp(last))
+            for (filename, size, mtime_ns, content_hash, columns, row_count, first, last) in rows]
+
+    def filenames(self):
+        """ Returns the sorted list of data file names """
+        return [entry.filename for entry in self.entries()]
+
+    def summary(self):
+        """ Returns a FolderSummary of the folder (as of the last scan) """
+        entries = self.entries()
+        parsed = [entry for entry in entries if entry.parsed]
+        timed = [entry for entry in entries if entry.first is not None and entry.last is not None]
+
+        columns = []
+        for entry in entries:
+            for column in entry.columns:
+                if column not in columns:
+                    columns.append(column)
+
+        return FolderSummary(
+            len(entries), sum(entry.size for entry in entries), sum(entry.rows for entry in parsed),
+            min(entry.first for entry in timed) if timed else None,
+            max(entry.last for entry in timed) if timed else None,
+            len(entries) - len(parsed), columns)
+
+    def clear(self):
+        """ Forgets every file, so the next scan treats them all as new """
+        with closing(self._connect()) as connection, connection:
+            connection.execute("DELETE FROM files")
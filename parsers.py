@@ -0,0 +1,237 @@
+"""
+parsers.py
+
+@author: James Fowkes
+
+CSV parser backends for logger files.
+
+Every parser gives the same dataframe: the date and time columns (the second and third columns)
+are combined into a timestamp index named "<Date>_<Time>" (as pandas names it), and the other columns follow in order.
+
+ - pandas: pandas' C parser, with the date format worked out for each value. Handles any layout pandas can.
+ - pyarrow: pyarrow's multithreaded CSV reader (only if pyarrow is installed)
+ - numpy: for the fixed logger layout (dd/mm/yy or dd/mm/yyyy dates and HH:MM:SS times).
+   Timestamps are decoded from their fixed-width fields with numpy, and the value columns
+   are parsed by pandas' C parser with no date handling.
+
+If a parser cannot handle a file (it is not installed, or the file is not in the layout it expects),
+the file is parsed again with pandas.
+"""
+
+import io
+import logging
+import datetime
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PARSER = "pandas"
+
+# Two digit years are taken to be within this many years of the current year (as pandas does)
+TWO_DIGIT_YEAR_WINDOW = 50
+
+class ParserUnsuitable(ValueError):
+    """ Raised by a parser that cannot handle a file """
+    pass
+
+def get_module_logger():
+
+    """ Returns logger for this module """
+    return logging.getLogger(__name__)
+
+def index_name(columns):
+    """ Returns the name pandas gives the combined date and time column, from the header column names """
+    return "%s_%s" % (columns[1], columns[2])
+
+def parse_pandas(data_file, chunk_rows=None):
+    """
+    Parses a CSV file with pandas. Returns an iterator of dataframes (of chunk_rows rows each),
+    or a single dataframe if chunk_rows is None.
+    Args:
+    data_file: Binary file object of the CSV data
+    chunk_rows: Rows per dataframe, or None to parse the whole file at once
+    """
+    return pd.read_csv(data_file, parse_dates=[[1, 2]], dayfirst=True, index_col=0, chunksize=chunk_rows)
+
+def combine_date_time(dates, times):
+    """
+    Returns a DatetimeIndex from series of day first date text and time text
+    (trying the logger formats first, which is much faster than working out the format of each value)
+    """
+    dates = dates.astype(str).str.strip()
+    if len(dates) and dates.str.match(r"\d\d/\d\d/\d\d$").all():
+        # dd/mm/yy: expand the years as the numpy parser does (strptime's %y puts 69-99 in the 1900s)
+        years = two_digit_years(dates.str[6:].astype(np.int64).values)
+        dates = dates.str[:6] + pd.Series(years, index=dates.index).astype(str)
+
+    text = dates + " " + times.astype(str).str.strip()
+    try:
+        return pd.DatetimeIndex(pd.to_datetime(text, format="%d/%m/%Y %H:%M:%S"))
+    except ValueError:
+        return pd.DatetimeIndex(pd.to_datetime(text, dayfirst=True))
+
+def parse_pyarrow(data_file):
+    """ Parses a CSV file with pyarrow's CSV reader and returns its dataframe """
+    try:
+        from pyarrow import csv as arrow_csv #pylint: disable=import-outside-toplevel
+    except ImportError as exc:
+        raise ParserUnsuitable("pyarrow is not installed") from exc
+
+    table = arrow_csv.read_csv(data_file)
+    columns = table.column_names
+    if len(columns) < 3:
+        raise ParserUnsuitable("Fewer than three columns")
+
+    # The date is not in a format pyarrow recognises, but the time may have been read as a time of day
+    index = combine_date_time(table.column(1).to_pandas(), table.column(2).to_pandas())
+
+    dataframe = table.select([i for i in range(len(columns)) if i not in (1, 2)]).to_pandas()
+    dataframe.index = index.rename(index_name(columns))
+    return dataframe
+
+def two_digit_years(years):
+    """ Returns four digit years from an array of two digit years, in the same way that pandas reads them """
+    this_year = datetime.date.today().year
+    years = years + (this_year // 100) * 100
+    years[years >= this_year + TWO_DIGIT_YEAR_WINDOW] -= 100
+    years[years < this_year - TWO_DIGIT_YEAR_WINDOW] += 100
+    return years
+
+def fixed_width_numbers(buffer, starts, offsets):
+    """
+    Returns the numbers made up of the digits at offsets from each line start
+    Raises ParserUnsuitable if any of those characters is not a digit
+    Args:
+    buffer: The file contents as a uint8 array
+    starts: Array of the position of each line
+    offsets: List of the offsets (within each line) of the digits of the number, most significant first
+    """
+    digits = buffer[starts[:, np.newaxis] + np.array(offsets)[np.newaxis, :]].astype(np.int64) - ord("0")
+    if ((digits < 0) | (digits > 9)).any():
+        raise ParserUnsuitable("Not a digit in a fixed width field")
+    return digits.dot(10 ** np.arange(len(offsets) - 1, -1, -1))
+
+def decode_timestamps(buffer, starts, date_offset):
+    """
+    Returns datetime64[ns] timestamps decoded from the fixed width date and time fields of each line
+    Raises ParserUnsuitable if any line does not have the same layout as the first
+    Args:
+    buffer: The file contents as a uint8 array
+    starts: Array of the position of each line
+    date_offset: Offset of the date field from the start of each line
+    """
+    first = starts[0] + date_offset
+    if buffer[first + 8] == ord(","):
+        year_offsets = [6, 7]
+    elif first + 10 < len(buffer) and buffer[first + 10] == ord(","):
+        year_offsets = [6, 7, 8, 9]
+    else:
+        raise ParserUnsuitable("Date is not dd/mm/yy or dd/mm/yyyy")
+
+    time_offset = date_offset + year_offsets[-1] + 2
+
+    separators = [
+        (date_offset - 1, ","), (date_offset + 2, "/"), (date_offset + 5, "/"), (time_offset - 1, ","),
+        (time_offset + 2, ":"), (time_offset + 5, ":"), (time_offset + 8, ",")]
+
+    if starts[-1] + time_offset + 8 >= len(buffer):
+        raise ParserUnsuitable("Last line is too short")
+
+    for (offset, separator) in separators:
+        if (buffer[starts + offset] != ord(separator)).any():
+            raise ParserUnsuitable("Lines do not all have the same layout")
+
+    days = fixed_width_numbers(buffer, starts, [date_offset, date_offset + 1])
+    months = fixed_width_numbers(buffer, starts, [date_offset + 3, date_offset + 4])
+    years = fixed_width_numbers(buffer, starts, [date_offset + offset for offset in year_offsets])
+    if len(year_offsets) == 2:
+        years = two_digit_years(years)
+
+    seconds = (
+        fixed_width_numbers(buffer, starts, [time_offset, time_offset + 1]) * 3600 +
+        fixed_width_numbers(buffer, starts, [time_offset + 3, time_offset + 4]) * 60 +
+        fixed_width_numbers(buffer, starts, [time_offset + 6, time_offset + 7]))
+
+    if (months < 1).any() or (months > 12).any() or (days < 1).any() or (days > 31).any():
+        raise ParserUnsuitable("Date out of range")
+
+    month_starts = (years - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (months - 1)
+    timestamps = month_starts.astype("datetime64[D]") + (days - 1)
+
+    # Days past the end of the month (e.g. 31/02) would roll over into the next month
+    if (timestamps.astype("datetime64[M]") != month_starts).any():
+        raise ParserUnsuitable("Day out of range for month")
+
+    return timestamps.astype("datetime64[ns]") + seconds.astype("timedelta64[s]")
+
+def parse_numpy(data_file):
+    """ Parses a CSV file in the fixed logger layout and returns its dataframe """
+    data = data_file.read()
+    buffer = np.frombuffer(data, dtype=np.uint8)
+
+    # Each line starts after a newline. Ignore the header, and any empty lines at the end of the file.
+    starts = np.flatnonzero(buffer == ord("\n")) + 1
+    while len(starts) and (starts[-1] >= len(buffer) or buffer[starts[-1]] in (ord("\n"), ord("\r"))):
+        starts = starts[:-1]
+
+    columns = [column.strip() for column in data[:starts[0] if len(starts) else len(data)].decode("utf8").split(",")]
+    if len(starts) == 0 or len(columns) < 4:
+        raise ParserUnsuitable("No data lines, or too few columns")
+
+    date_offset = data.find(b",", starts[0]) + 1 - starts[0]
+    if date_offset <= 0:
+        raise ParserUnsuitable("No reference column")
+
+    timestamps = decode_timestamps(buffer, starts, date_offset)
+
+    dataframe = pd.read_csv(io.BytesIO(data), usecols=[i for i in range(len(columns)) if i not in (1, 2)])
+    if len(dataframe) != len(timestamps):
+        raise ParserUnsuitable("Not every line has a timestamp")
+
+    dataframe.index = pd.DatetimeIndex(timestamps, name=index_name(columns))
+    return dataframe
+
+# Parsers that read a whole file, by name (pandas is handled separately, as it can read in chunks)
+WHOLE_FILE_PARSERS = OrderedDict([("pyarrow", parse_pyarrow), ("numpy", parse_numpy)])
+
+PARSER_NAMES = [DEFAULT_PARSER] + list(WHOLE_FILE_PARSERS)
+
+def read_chunks(open_source, parser=DEFAULT_PARSER, chunk_rows=None):
+    """
+    Generates the dataframes parsed from a CSV file.
+    The pandas parser gives dataframes of chunk_rows rows (or one dataframe if chunk_rows is None),
+    the other parsers give one dataframe for the whole file.
+    If the parser cannot handle the file, it is parsed with pandas instead.
+    Args:
+    open_source: Function that returns a new binary file object of the CSV data (it is called again to fall back)
+    parser: One of PARSER_NAMES
+    chunk_rows: Rows per dataframe for the pandas parser
+    """
+    if parser in WHOLE_FILE_PARSERS:
+        dataframe = None
+        try:
+            with open_source() as data_file:
+                dataframe = WHOLE_FILE_PARSERS[parser](data_file)
+        except (ValueError, TypeError, IndexError, ImportError) as exc:
+            get_module_logger().info("%s parser could not read file, using pandas (%s)", parser, exc)
+
+        if dataframe is not None:
+            yield dataframe
+            return
+
+    with open_source() as data_file:
+        if chunk_rows is None:
+            yield parse_pandas(data_file)
+        else:
+            for chunk in parse_pandas(data_file, chunk_rows):
+                yield chunk
+
+def parse(open_source, parser=DEFAULT_PARSER):
+    """
+    Returns the dataframe parsed from a whole CSV file (see read_chunks)
+    Args:
+    open_source: Function that returns a new binary file object of the CSV data
+    parser: One of PARSER_NAMES
+    """
+    return list(read_chunks(open_source, parser))[0]
@@ -8,18 +8,74 @@ Defines a data plotter for the CSV viewer application using
 """
 
 import logging
+import datetime
 
-from windrose import WindroseAxes
+import numpy as np
+
+from count_tables import WindHistogram
+
+# matplotlib and windrose are imported when something is first drawn, not when this module is imported,
+# so that the application window can be shown before they are loaded.
+
+NANOSECONDS_PER_DAY = 86400 * 1e9
+
+# Bar width (in days) used when the sampling interval cannot be determined
+DEFAULT_BAR_WIDTH = 10/86400
 
 def get_module_logger():
     """ Returns logger for this module """
     return logging.getLogger(__name__)
 
+def unix_epoch_datenum():
+    """ Returns the matplotlib date number of the unix epoch (depends on matplotlib's own epoch setting) """
+    import matplotlib.dates as mdates #pylint: disable=import-outside-toplevel
+    return mdates.date2num(datetime.datetime(1970, 1, 1))
+
 #pylint: disable=too-few-public-methods
 class InvalidDataException(Exception):
     """ Just rename the base exception class """
     pass
 
+def date_numbers(times):
+    """ Converts a sequence of timestamps to an array of matplotlib date numbers
+    Args:
+    times - the timestamps (datetime-like objects, numpy datetime64 array or pandas index)
+    """
+    nanoseconds = np.asarray(times, dtype='datetime64[ns]').astype(np.int64)
+    return unix_epoch_datenum() + nanoseconds / NANOSECONDS_PER_DAY
+
+def bar_polygons(times, data):
+    """
+    Returns an (N, 4, 2) array of bar outlines, one bar per finite data point.
+    Bars are centred on their timestamp and are as wide as the median sampling interval.
+    Args:
+    times - the timestamps for the data
+    data - the bar heights
+    """
+    xvals = date_numbers(times)
+    yvals = np.asarray(data, dtype=float)
+
+    width = np.median(np.diff(xvals)) if len(xvals) > 1 else DEFAULT_BAR_WIDTH
+    if not width > 0:
+        width = DEFAULT_BAR_WIDTH # Duplicate timestamps, fall back to the old fixed width
+
+    finite = np.isfinite(yvals)
+    xvals = xvals[finite]
+    yvals = yvals[finite]
+
+    left = xvals - width/2
+    right = xvals + width/2
+
+    verts = np.zeros((len(xvals), 4, 2))
+    verts[:, 0, 0] = left
+    verts[:, 1, 0] = left
+    verts[:, 1, 1] = yvals
+    verts[:, 2, 0] = right
+    verts[:, 2, 1] = yvals
+    verts[:, 3, 0] = right
+
+    return verts
+
 class DataSet:
 
     """ Simple object to store data, timestamps and a label for the data """
@@ -35,8 +91,7 @@ class WindPlotter:
 
     def __init__(self, configmanager):
         """ Initialise the wind plotter """
-        self.windspeed = None
-        self.direction = None
+        self.wind_histogram = None
         self.configmanager = configmanager
 
     def set_data(self, speed, direction):
@@ -48,21 +103,36 @@ class WindPlotter:
         """
 
         if len(speed) == len(direction):
-            self.windspeed = speed
-            self.direction = direction
+            self.wind_histogram = WindHistogram(direction, speed)
         else:
             raise InvalidDataException(
                 "Length of direction (%d) and speed (%d) lists are not equal" % (len(direction), len(speed)))
 
-    def draw(self, fig):
+    def set_wind_histogram(self, wind_histogram):
+        """
+        Set the data to display from an existing table, reusing its cached counts
+        Args:
+        wind_histogram - count_tables.WindHistogram or FixedWindTable of the speed and direction data
+        """
+        self.wind_histogram = wind_histogram
+
+    def draw(self, fig, _=None):
+
+        """ Draw windrose plot of current data on figure
+        Args:
+        fig - The figure to draw on
+        _ - Placeholder for plotting styles (not used)
+        """
 
-        """ Draw windrose plot of current data on figure """
+        # windrose pulls in pylab and the polar projection, so only import it when a windrose is drawn
+        from windrose import WindroseAxes #pylint: disable=import-outside-toplevel
 
         try:
             axes = WindroseAxes(fig, rect=[0.1, 0.1, 0.8, 0.8])
             fig.add_axes(axes)
 
-            axes.bar(self.direction, self.windspeed, normed=True)
+            # The table is computed from wind_histogram, so no direction/speed arrays are needed
+            axes.bar(None, None, normed=True, wind_histogram=self.wind_histogram)
 
             axes.set_title("Windrose (by % in 6 bins)")
             legend = axes.legend(borderaxespad=-0.10, fontsize=8, bbox_to_anchor=(-0.2, 0))
@@ -86,25 +156,35 @@ class Histogram:
     """ Implements plotting of generic histogram """
 
     def __init__(self):
-        self.data = None
+        self.counts = None
+        self.edges = None
         self.label = ""
 
-
-    def set_data(self, data, label):
+    def set_counts(self, counts, edges, label):
         """
         Args:
-        data - The data to display
+        counts - The number of data points in each bin
+        edges - The bin edges (one more than the number of counts)
         label - The label for the x-axis
         """
-        self.data = data
+        self.counts = counts
+        self.edges = edges
         self.label = label
 
-    def draw(self, fig):
+    def draw(self, fig, _=None):
 
-        """ Draw histogram of current data on figure """
+        """ Draw histogram of current counts on figure (normalised to unit area)
+        Args:
+        fig - The figure to draw on
+        _ - Placeholder for plotting styles (not used)
+        """
+
+        widths = np.diff(self.edges)
+        total = self.counts.sum()
+        density = self.counts / (total * widths) if total > 0 else np.zeros(len(self.counts))
 
         axes = fig.add_subplot(111)
-        axes.hist(self.data, 50, normed=1)
+        axes.bar(self.edges[:-1], density, width=widths, align='edge')
 
         axes.set_xlabel(self.label)
         axes.set_ylabel("Frequency (%)")
@@ -116,17 +196,9 @@ class Plotter:
 
     def __init__(self, configmanager):
         """ Initialise the plotter """
-        self.suspend = False
         self.configmanager = configmanager
         self.clear_data()
 
-    def suspend_draw(self, suspend):
-        """
-        Args:
-        suspend - If true, updates to the plot will not cause the plot to automatically redraw
-        """
-        self.suspend = suspend
-
     def clear_data(self):
         """
         Clears all subplots and associated data
@@ -181,8 +253,7 @@ class Plotter:
     def draw(self, fig, styles):
 
         """ Draws this plot on provided figure """
-        if self.suspend:
-            return # Drawing has been suspended
+        from matplotlib.collections import PolyCollection #pylint: disable=import-outside-toplevel
 
         fig.clf()
 
@@ -200,9 +271,13 @@ class Plotter:
                     axis.plot(
                         self.subplot_data[idx].times, self.subplot_data[idx].data, color=styles[idx][1])
                 elif styles[idx][0] == "bar":
-                    axis.bar(
-                        self.subplot_data[idx].times, self.subplot_data[idx].data,
-                        align="center", width=(10/86400), color=styles[idx][1], edgecolor=styles[idx][1])
+                    # All bars are drawn as a single collection rather than one patch per sample
+                    bars = PolyCollection(
+                        bar_polygons(self.subplot_data[idx].times, self.subplot_data[idx].data),
+                        facecolors=styles[idx][1], edgecolors=styles[idx][1])
+                    axis.add_collection(bars)
+                    axis.xaxis_date()
+                    axis.autoscale_view()
 
                 axis.set_ylabel(self.subplot_data[idx].ylabel, fontsize=10)
 
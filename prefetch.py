@@ -0,0 +1,111 @@
+"""
+prefetch.py
+
+@author: James Fowkes
+
+Reads files into memory on a background thread, ahead of them being needed.
+
+While the data manager parses one CSV file, the next few are read from disk,
+so parsing does not have to wait for the disk (and the disk does not wait for parsing).
+"""
+
+import os
+import logging
+import threading
+
+def get_module_logger():
+
+    """ Returns logger for this module """
+    return logging.getLogger(__name__)
+
+class FilePrefetcher:
+
+    """
+    Reads the bytes of a list of files, in order, at most max_files and max_bytes ahead of the reader.
+
+    The reader must get() every file, in the same order as the list (or close() the prefetcher),
+    otherwise the prefetching thread waits for space forever.
+    Files bigger than max_bytes are not prefetched: get() returns None for them,
+    and the reader should read them itself. So does a file that could not be read
+    (the reader then gets the error when it reads the file).
+    """
+
+    def __init__(self, paths, max_files, max_bytes):
+        """
+        Args:
+        paths: The files to read, in the order they will be needed
+        max_files: The most files to hold in memory at once
+        max_bytes: The most bytes to hold in memory at once
+        """
+        self.paths = list(paths)
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+
+        self._buffered = {} # Path to bytes (or None if not prefetched)
+        self._buffered_bytes = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, name="FilePrefetcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        """ Reads each file once there is space for it """
+        for path in self.paths:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                size = None
+
+            prefetch = size is not None and size <= self.max_bytes
+            cost = size if prefetch else 0
+
+            with self._condition:
+                while not self._closed and self._buffered and (
+                        len(self._buffered) >= self.max_files or self._buffered_bytes + cost > self.max_bytes):
+                    self._condition.wait()
+
+                if self._closed:
+                    return
+
+                # Hold the space for this file while it is being read
+                self._buffered_bytes += cost
+
+            data = None
+            if prefetch:
+                try:
+                    with open(path, "rb") as data_file:
+                        data = data_file.read()
+                except OSError as exc:
+                    get_module_logger().info("Could not prefetch %s (%s)", path, exc)
+
+            with self._condition:
+                self._buffered[path] = data
+                self._buffered_bytes += (len(data) if data is not None else 0) - cost
+                self._condition.notify_all()
+
+    def get(self, path):
+        """
+        Returns the bytes of a file (waiting until it has been read), or None if it was not prefetched
+        Args:
+        path: The next file in the list
+        """
+        with self._condition:
+            while path not in self._buffered and not self._closed and self._thread.is_alive():
+                self._condition.wait(0.1)
+
+            data = self._buffered.pop(path, None)
+            if data is not None:
+                self._buffered_bytes -= len(data)
+            self._condition.notify_all()
+
+        return data
+
+    def close(self):
+        """ Stops prefetching and drops any prefetched bytes """
+        with self._condition:
+            self._closed = True
+            self._buffered = {}
+            self._buffered_bytes = 0
+            self._condition.notify_all()
@@ -0,0 +1,173 @@
+"""
+timing.py
+
+@author: James Fowkes
+
+Lightweight span timing, used to find where time goes when loading and drawing data.
+
+Code is wrapped in spans:
+
+    with timing.span("read_csv", file=filename) as span:
+        ...
+        span.set(rows=row_count, bytes=byte_count)
+
+When timing is disabled (the default) span() returns a shared object that does nothing,
+so instrumented code costs one function call and attribute lookup per span.
+"""
+
+import functools
+import json
+import threading
+import time
+
+class Span:
+
+    """ A single timed stage. Extra fields (e.g. rows, bytes) can be set while the span is open """
+
+    def __init__(self, recorder, name, fields):
+        """
+        Args:
+        recorder: The SpanRecorder the span is added to when it finishes
+        name: The name of the stage
+        fields: Dictionary of any extra information about the stage
+        """
+        self.recorder = recorder
+        self.name = name
+        self.fields = fields
+        self.thread = threading.current_thread().name
+        self.start = None
+        self.duration = None
+
+    def set(self, **fields):
+        """ Add or update extra information about the stage """
+        self.fields.update(fields)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.duration = time.perf_counter() - self.start
+        self.recorder.add(self)
+        return False
+
+    def as_dict(self):
+        """ Returns the span as a dictionary (times in seconds, start relative to when recording began) """
+        span_dict = {
+            "name":self.name, "thread":self.thread,
+            "start":self.start - self.recorder.origin, "duration":self.duration}
+        span_dict.update(self.fields)
+        return span_dict
+
+class NullSpan:
+
+    """ Stands in for a Span when timing is disabled. Does nothing. """
+
+    def set(self, **_):
+        """ Ignore any extra information """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+NULL_SPAN = NullSpan()
+
+class SpanRecorder:
+
+    """ Collects finished spans from any thread """
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = time.perf_counter()
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def span(self, name, **fields):
+        """ Returns a new span (or the null span if recording is disabled)
+        Args:
+        name: The name of the stage
+        fields: Any extra information about the stage
+        """
+        return Span(self, name, fields) if self.enabled else NULL_SPAN
+
+    def add(self, span):
+        """ Add a finished span to the recording """
+        with self._lock:
+            self._spans.append(span)
+
+    def clear(self):
+        """ Discard all recorded spans """
+        with self._lock:
+            self._spans = []
+
+    def get_spans(self):
+        """ Returns a list of dictionaries, one per recorded span, in order of completion """
+        with self._lock:
+            return [span.as_dict() for span in self._spans]
+
+RECORDER = SpanRecorder()
+
+def span(name, **fields):
+    """ Returns a new span from the global recorder
+    Args:
+    name: The name of the stage
+    fields: Any extra information about the stage (e.g. rows=100)
+    """
+    return RECORDER.span(name, **fields)
+
+def timed(function):
+    """ Decorator: records each call of a function as a span named after the function """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        """ Calls the wrapped function inside a span """
+        with RECORDER.span(function.__qualname__):
+            return function(*args, **kwargs)
+    return wrapper
+
+def enable(enabled=True):
+    """ Turn span recording on or off """
+    RECORDER.enabled = enabled
+
+def is_enabled():
+    """ Returns True if spans are being recorded """
+    return RECORDER.enabled
+
+def get_spans():
+    """ Returns a list of dictionaries, one per recorded span """
+    return RECORDER.get_spans()
+
+def clear():
+    """ Discard all recorded spans """
+    RECORDER.clear()
+
+def dump_json(path):
+    """ Write all recorded spans to a JSON file
+    Args:
+    path: The file to write
+    """
+    with open(path, "w") as json_file:
+        json.dump(get_spans(), json_file, indent=1)
+
+def summarise(spans):
+    """
+    Returns lines of text summarising spans by name: count, total and mean time,
+    and the total rows and bytes (where spans recorded them)
+    Args:
+    spans: List of span dictionaries (from get_spans)
+    """
+    totals = {}
+    for span_dict in spans:
+        (count, seconds, rows, byte_count) = totals.get(span_dict["name"], (0, 0., 0, 0))
+        totals[span_dict["name"]] = (
+            count + 1, seconds + span_dict["duration"],
+            rows + span_dict.get("rows", 0), byte_count + span_dict.get("bytes", 0))
+
+    lines = ["%-30s %6s %10s %10s %12s %12s" % ("Stage", "Count", "Total (s)", "Mean (ms)", "Rows", "MB")]
+    for name, (count, seconds, rows, byte_count) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        lines.append("%-30s %6d %10.3f %10.1f %12d %12.1f" % (
+            name, count, seconds, seconds * 1000 / count, rows, byte_count / 1e6))
+
+    return lines
@@ -127,6 +127,13 @@ class TkLabelledEntryHelper(TkEntryHelper):
         self.label.pack(**self.label_pack_kwargs)
         TkEntryHelper.pack(self, **kwargs)
 
+    def pack_forget(self):
+        """
+        Overrides the Tk pack_forget() method to also hide the label
+        """
+        self.label.pack_forget()
+        TkEntryHelper.pack_forget(self)
+
 #pylint: disable=too-few-public-methods
 #pylint: disable=too-many-ancestors
 #pylint: disable=star-args
@@ -30,11 +30,13 @@ __license__ = 'CeCILL-B'
 import matplotlib
 import matplotlib.cm as cm
 import numpy as np
+from matplotlib.collections import Collection, PolyCollection
 from matplotlib.patches import Rectangle
 from matplotlib.projections.polar import PolarAxes
-from numpy.lib.twodim_base import histogram2d
 from pylab import poly_between
 
+from count_tables import WindHistogram
+
 RESOLUTION = 100
 ZBASE = -1000 #The starting zorder for all drawing, negative to have the grid on
 
@@ -45,6 +47,28 @@ def _colors(cmap, num):
     '''
     return [cmap(i) for i in np.linspace(0.0, 1.0, num)]
 
+def _sector_bar_polygons(angles, opening, bottoms, heights):
+    '''
+    Returns an (nsector, 4, 2) array of bar outlines in (theta, r) coordinates,
+    one bar per sector centred on its angle
+
+    '''
+    left = angles - opening/2
+    right = angles + opening/2
+    tops = bottoms + heights
+
+    verts = np.empty((len(angles), 4, 2))
+    verts[:, 0, 0] = left
+    verts[:, 0, 1] = bottoms
+    verts[:, 1, 0] = right
+    verts[:, 1, 1] = bottoms
+    verts[:, 2, 0] = right
+    verts[:, 2, 1] = tops
+    verts[:, 3, 0] = left
+    verts[:, 3, 1] = tops
+
+    return verts
+
 class WindroseAxes(PolarAxes):
     """
 
@@ -157,6 +181,8 @@ class WindroseAxes(PolarAxes):
                 if isinstance(patch, matplotlib.patches.Polygon) or \
                 isinstance(patch, matplotlib.patches.Rectangle):
                     color = patch.get_facecolor()
+                elif isinstance(patch, Collection):
+                    color = patch.get_facecolor()[0]
                 elif isinstance(patch, matplotlib.lines.Line2D):
                     color = patch.get_color()
                 else:
@@ -184,16 +210,25 @@ class WindroseAxes(PolarAxes):
     def _init_plot(self, direction, var, **kwargs):
         """
         Internal method used by all plotting commands
+        As well as the options of the plotting commands, accepts:
+        * wind_histogram : count_tables.WindHistogram of direction and var. Passing
+        the same object to several plots reuses its cached sector/bin assignments.
         """
         #self.cla()
         _ = kwargs.pop('zorder', None)
 
+        #A WindHistogram can be passed in so that its cached sector/bin assignments are reused
+        wind_histogram = kwargs.pop('wind_histogram', None)
+        if wind_histogram is None:
+            wind_histogram = WindHistogram(direction, var)
+        var_min, var_max = wind_histogram.var_range()
+
         #Init of the bins array if not set
         bins = kwargs.pop('bins', None)
         if bins is None:
-            bins = np.linspace(np.min(var), np.max(var), 6)
+            bins = np.linspace(var_min, var_max, 6)
         if isinstance(bins, int):
-            bins = np.linspace(np.min(var), np.max(var), bins)
+            bins = np.linspace(var_min, var_max, bins)
         bins = np.asarray(bins)
         nbins = len(bins)
 
@@ -223,7 +258,7 @@ class WindroseAxes(PolarAxes):
         blowto = kwargs.pop('blowto', False)
 
         #Set the global information dictionary
-        information_dict = histogram(direction, var, bins, nsector, normed, blowto)
+        information_dict = wind_histogram.table(bins, nsector, normed, blowto)
         self._info['direction'], self._info['bins'], self._info['table'] = information_dict
 
         return bins, nbins, nsector, colors, angles, kwargs
@@ -389,20 +424,7 @@ class WindroseAxes(PolarAxes):
         dtheta = 2*np.pi/nsector
         opening = dtheta*opening
 
-        for j in range(nsector):
-            offset = 0
-            for i in range(nbins):
-                if i > 0:
-                    offset += self._info['table'][i-1, j] #pylint: disable=invalid-sequence-index
-                val = self._info['table'][i, j] #pylint: disable=invalid-sequence-index
-                zorder = ZBASE + nbins - i
-                patch = Rectangle(
-                    (angles[j]-opening/2, offset), opening, val,
-                    facecolor=colors[i], edgecolor=edgecolor, zorder=zorder,
-                    **kwargs)
-                self.add_patch(patch)
-                if j == 0:
-                    self.patches_list.append(patch)
+        self._add_bar_collections(angles, [opening]*nbins, colors, edgecolor, **kwargs)
         self._update()
 
 
@@ -439,8 +461,8 @@ class WindroseAxes(PolarAxes):
         # In the meantime, disable the warning
         #pylint: disable=too-many-locals
 
-        # _ is for bins, which is not required
-        _, nbins, nsector, colors, angles, kwargs = self._init_plot(direction, var, **kwargs)
+        # _ is for bins and nsector, which are not required
+        _, nbins, _, colors, angles, kwargs = self._init_plot(direction, var, **kwargs)
         _ = kwargs.pop('facecolor', None)
         edgecolor = kwargs.pop('edgecolor', None)
         if edgecolor is not None:
@@ -448,22 +470,35 @@ class WindroseAxes(PolarAxes):
                 raise ValueError('edgecolor must be a string color')
         opening = np.linspace(0.0, np.pi/16, nbins)
 
-        for j in range(nsector):
-            offset = 0
-            for i in range(nbins):
-                if i > 0:
-                    offset += self._info['table'][i-1, j] #pylint: disable=invalid-sequence-index
-                val = self._info['table'][i, j] #pylint: disable=invalid-sequence-index
-                zorder = ZBASE + nbins - i
-                patch = Rectangle(
-                    (angles[j]-opening[i]/2, offset), opening[i],
-                    val, facecolor=colors[i], edgecolor=edgecolor,
-                    zorder=zorder, **kwargs)
-                self.add_patch(patch)
-                if j == 0:
-                    self.patches_list.append(patch)
+        self._add_bar_collections(angles, opening, colors, edgecolor, **kwargs)
         self._update()
 
+    def _add_bar_collections(self, angles, openings, colors, edgecolor, **kwargs):
+        """
+        Internal method used by bar and box plots.
+        Draws the stacked bars of the current table, adding all the bars of
+        each var bin as a single PolyCollection (which is also its legend entry).
+        * angles : 1D array - the centre angle of each sector
+        * openings : sequence - angular width of the bars for each bin
+        * colors : sequence - the color for each bin
+        * edgecolor : string - the color of the bar edges (None for the default)
+        """
+        table = self._info['table']
+        nbins = table.shape[0]
+
+        # Each bin is stacked on top of all the bins before it
+        bottoms = np.cumsum(table, axis=0) - table
+
+        if edgecolor is not None:
+            kwargs['edgecolors'] = edgecolor
+
+        for i in range(nbins):
+            verts = _sector_bar_polygons(
+                angles, openings[i], bottoms[i, :], table[i, :]) #pylint: disable=invalid-sequence-index
+            collection = PolyCollection(verts, facecolors=[colors[i]], zorder=ZBASE + nbins - i, **kwargs)
+            self.add_collection(collection)
+            self.patches_list.append(collection)
+
 def histogram(direction, var, bins, nsector, normed=False, blowto=False): #pylint: disable=too-many-arguments
     """
     Returns an array where, for each sector of wind
@@ -479,32 +514,8 @@ def histogram(direction, var, bins, nsector, normed=False, blowto=False): #pylin
     as wind blows from. If true, the table will be reversed (usefull for
     pollutantrose)
 
+    To compute several tables from the same data, use a count_tables.WindHistogram,
+    which caches the sector and bin of each sample between calls.
     """
 
-    if len(var) != len(direction):
-        raise ValueError("var (%d) and direction (%d) must have same length" % (len(var), len(direction)))
-
-    angle = 360./nsector
-
-    dir_bins = np.arange(-angle/2, 360.+angle, angle, dtype=np.float)
-    dir_edges = dir_bins.tolist()
-    dir_edges.pop(-1)
-    dir_edges[0] = dir_edges.pop(-1)
-    dir_bins[0] = 0.
-
-    var_bins = bins.tolist()
-    var_bins.append(np.inf)
-
-    if blowto:
-        direction = direction + 180.
-        direction[direction >= 360.] = direction[direction >= 360.] - 360
-
-    table = histogram2d(x=var, y=direction, bins=[var_bins, dir_bins], normed=False)[0]
-    # add the last value to the first to have the table of North winds
-    table[:, 0] = table[:, 0] + table[:, -1]
-    # and remove the last col
-    table = table[:, :-1]
-    if normed:
-        table = table*100/table.sum()
-
-    return dir_edges, var_bins, table
+    return WindHistogram(direction, var).table(bins, nsector, normed, blowto)